@@ -1,8 +1,5 @@
 import asyncio
-import json
 import logging
-import operator
-from collections import namedtuple
 
 import discord
 from discord.ext import commands
@@ -71,16 +68,21 @@ class _TupleDict(dict):
 
 
 class UserSurrended(Exception):
-    def __init__(self, user):
+    def __init__(self, player):
         super().__init__()
-        self.user = user
+        self.player = player
 
 
-move = namedtuple("move", "name type severity")
+async def owner_of(demon):
+    """The User to DM for a demon. Counts as surrendering if their account can't be found."""
+    user = await demon.owner.fetch_owner()
+    if user is None:
+        raise UserSurrended(demon.owner)
+    return user
 
 
 async def surrender(demon, bot):
-    user = demon.owner.owner
+    user = await owner_of(demon)
     msg = await user.send("Are you sure you want to surrender the battle?")
 
     rs = [str(blobs.BLOB_TICK), str(blobs.BLOB_CROSS)]
@@ -96,20 +98,17 @@ async def surrender(demon, bot):
     try:
         r, _ = await bot.wait_for("reaction_add", check=r_check, timeout=30)
     except asyncio.TimeoutError:
-        raise UserSurrended(user)
+        raise UserSurrended(demon.owner)
     else:
         if str(r) == rs[0]:
-            raise UserSurrended(user)
+            raise UserSurrended(demon.owner)
     finally:
         await msg.delete()
 
 
 async def fight(demon, bot):
-    print(f"{demon}, {demon.name}, {demon.owner}")
-    user = demon.owner.owner
-    _moves = await bot.db.fetchval("SELECT moves FROM persona_lookup WHERE name=$1;", demon.name)
-    print(f"_moves")
-    moves = json.loads(_moves)
+    user = await owner_of(demon)
+    moves = demon.moves
     if not moves:
         raise RuntimeError(f"No moves found for demon {demon.name}")
 
@@ -134,13 +133,11 @@ async def fight(demon, bot):
         try:
             reaction, _ = await bot.wait_for("reaction_add", check=react_check, timeout=120)
         except asyncio.TimeoutError:
-            await surrender(user, bot)
+            await surrender(demon, bot)
         else:
             if str(reaction) == '\u21a9':
                 return None
-            name = reacts[str(reaction)]
-            type_, severity = moves[name]
-            return move(name, type_, severity)
+            return moves[reacts[str(reaction)]]
         finally:
             await msg.delete()
 
@@ -157,7 +154,7 @@ async def send_action(demon, bot):
     content = """1\u20e3: Fight
 2\u20e3: Use an item (doesnt work, redirects to fight)
 3\u20e3: Surrender"""
-    user = demon.owner.owner
+    user = await owner_of(demon)
     while ret is None:
         msg = await user.send(content)
 
@@ -207,7 +204,7 @@ async def battle_loop(ctx, alpha, beta):
                            return_when=asyncio.ALL_COMPLETED)
         surr = t_alpha.exception() or t_beta.exception()
         if isinstance(surr, UserSurrended):
-            if surr.user == alpha.owner.owner:
+            if surr.player is alpha.owner:
                 await ctx.send(f"{alpha.owner} surrendered! {beta.owner} won!")
             else:
                 await ctx.send(f"{beta.owner} surrendered! {alpha.owner} won!")
@@ -216,61 +213,57 @@ async def battle_loop(ctx, alpha, beta):
 
         m_alpha = t_alpha.result()
         m_beta = t_beta.result()
-        # await ctx.send((m_alpha, m_beta))
 
-        dt_alpha, res_alpha = alpha.take_damage(beta, m_beta.type, m_beta.severity)
-        msg_a = _MESSAGES[res_alpha.name].format(tdemon=alpha, move=m_beta.name, ademon=beta, damage=dt_alpha)
-
-        dt_beta, res_beta = beta.take_damage(alpha, m_alpha.type, m_alpha.severity)
-        msg_b = _MESSAGES[res_beta.name].format(tdemon=beta, move=m_alpha.name, ademon=alpha, damage=dt_beta)
+        turn = utils.resolve_turn(alpha, beta, m_alpha, m_beta)
+        msg_a = _MESSAGES[turn.alpha_hit.resistance.name].format(
+            tdemon=alpha, move=m_beta.name, ademon=beta, damage=turn.alpha_hit.damage_dealt)
+        msg_b = _MESSAGES[turn.beta_hit.resistance.name].format(
+            tdemon=beta, move=m_alpha.name, ademon=alpha, damage=turn.beta_hit.damage_dealt)
 
         await ctx.send(msg_a + "\n" + msg_b)
-    if alpha.is_fainted():
-        msg = f"{alpha} fainted! {beta.owner} and their {beta} won!\nYou were given 5,000 G as a reward!"
-        beta.owner.gold += 5000
-    elif beta.is_fainted():
-        msg = f"{beta} fainted! {alpha.owner} and their {alpha} won!\nYou were given 5,000 G as a reward!"
-        alpha.owner.gold += 5000
-    else:
+    won = utils.winner(alpha, beta)
+    if won is None:
         ctx.bot.wtf = ctx, alpha, beta
         raise RuntimeError("no one fainted? might have surrendered")
-    await ctx.send(msg)
+    lost = alpha if won is beta else beta
+    won.owner.gold += 5000
+    await ctx.send(f"{lost} fainted! {won.owner} and their {won} won!\nYou were given 5,000 G as a reward!")
 
 
 async def try_get_demon(ctx, player):
     em = ctx.bot.enemy_manager
     demons = {e.name for e in sorted(em.enemies, key=lambda e: e.id) if player.compendium.is_enemy_recorded(e)}
-    demons &= ctx.cog.valid
-    await player.owner.send(f"{blobs.BLOB_THINK} Choose a demon!")
-    await ctx.paginate(*demons, destination=player.owner)
+    demons &= ctx.cog.catalog.names
+    owner = await player.fetch_owner()
+    if owner is None:
+        return None
+    await owner.send(f"{blobs.BLOB_THINK} Choose a demon!")
+    await ctx.paginate(*demons, destination=owner)
     demons = set(map(str.lower, demons))
 
     def checker(m):
         return m.content.lower() in demons and \
             not m.guild and \
-            m.author == player.owner
+            m.author == owner
 
     rs = [str(blobs.BLOB_TICK), str(blobs.BLOB_CROSS)]
 
     def rchecker(r, u):
         return str(r) in rs and \
-            u == player.owner and \
+            u == owner and \
             r.message.id == n.id
 
     while True:
         choice = await ctx.bot.wait_for("message", check=checker)
         name = choice.content.title()
-        n = await player.owner.send(f"{blobs.BLOB_THINK} Are you sure you want to battle with {name}?")
+        n = await owner.send(f"{blobs.BLOB_THINK} Are you sure you want to battle with {name}?")
         for r in rs:
             await n.add_reaction(r)
         r, _ = await ctx.bot.wait_for("reaction_add", check=rchecker, timeout=10)
         if str(r) == rs[0]:
             break
 
-    data = await ctx.bot.db.fetchrow("SELECT * FROM persona_lookup WHERE name=$1;", name)
-
-    return utils.BattleDemon(name=data['name'], owner=player, hp=data['hp'], moves=data['moves'], stats=data['stats'],
-                             resistances=data['resistances'])
+    return utils.BattleDemon.from_persona(ctx.cog.catalog[name], player)
 
 
 class Battle(commands.Cog):
@@ -280,8 +273,22 @@ class Battle(commands.Cog):
         self.bot = bot
         self._fighting = _Dict()
         self._battles = _TupleDict()
-        self.valid = None
+        self.catalog = utils.PersonaCatalog()
         self.task_ender = self.bot.loop.create_task(self._task_ender())
+        self._catalog_loader = self.bot.loop.create_task(self._load_catalog())
+
+    async def _load_catalog(self):
+        await self.bot.prepared.wait()
+        try:
+            await self.refresh_catalog()
+        except Exception as e:
+            log.critical("Failed to load the persona catalog.\n%s: %s", type(e).__name__, str(e))
+
+    async def refresh_catalog(self):
+        """Reloads the persona catalog from persona_lookup.
+        Battles already running keep the demons they were started with."""
+        self.catalog = await utils.PersonaCatalog.fetch(self.bot.db)
+        log.info("Loaded %s personas.", len(self.catalog))
 
     async def _task_ender(self):
         while await asyncio.sleep(0, True):
@@ -327,9 +334,8 @@ class Battle(commands.Cog):
         WARNING: If you time out any menu, it will count as a forfeit.
 
         (disclaimer: not actually to the death)"""
-        if not self.valid:
-            self.valid = set(map(operator.itemgetter('name'),
-                                 await self.bot.db.fetch("SELECT name FROM persona_lookup")))
+        if not self.catalog:
+            return await ctx.send(f"{blobs.BLOB_SAD} Battles aren't ready yet, try again in a bit.")
 
         if user == ctx.author:
             return await ctx.send(f"{blobs.BLOB_ANGERY} You can't fight yourself!")
@@ -361,17 +367,16 @@ class Battle(commands.Cog):
             # idk if this is even useful but ok
             return await ctx.send(f"{blobs.BLOB_SAD} Everyone didn't finish in time.")
 
-        self._fighting[ctx.author.id] = user.id
-
         p1 = t1.result()
         p2 = t2.result()
+        if p1 is None or p2 is None:
+            return await ctx.send(f"{blobs.BLOB_SAD} I couldn't find everyone's account to message them.")
+
+        self._fighting[ctx.author.id] = user.id
 
         key = (ctx.author.id, user.id)
 
-        if p1.agility >= p2.agility:
-            self._battles[key] = self.bot.loop.create_task(battle_loop(ctx, p1, p2))
-        else:
-            self._battles[key] = self.bot.loop.create_task(battle_loop(ctx, p2, p1))
+        self._battles[key] = self.bot.loop.create_task(battle_loop(ctx, *utils.first_mover(p1, p2)))
 
         await ctx.send("Begin!")
         if not self.task_ender.done():
@@ -230,7 +230,7 @@ Enemies: {len(self.bot.enemy_manager.enemies)}"""
     async def patreon(self, ctx):
         """Gives you the Patreon link to support me.
         If you do donate to me, please contact me and I'll arrange adding you to the supporters list."""
-        if await self.bot.db.fetchval("SELECT userid FROM supporters WHERE userid=$1;", ctx.author.id):
+        if ctx.author.id in self.bot.supporters:
             return await ctx.send("Thank you for donating! If you don't have access to the supporter only functions,"
                                   " please contact me (Xua#4427) and I will fix it.")
         await ctx.send("I've set up a Patreon! You can donate to me via this link: <https://www.patreon.com/xua_yraili>"
@@ -247,27 +247,11 @@ Enemies: {len(self.bot.enemy_manager.enemies)}"""
         if not data:
             return await ctx.send(f"{blobs.BLOB_SAD} Couldn't find any data for you."
                                   f"\nIf you did have a player, then I'm afraid it's gone now.")
-        owner_id, name, map_id, created, explored, exp, compendium, gold, *_ = data
-        user = self.bot.get_user(owner_id)
-        status = await self.bot.redis.get(f"status_{owner_id}")
-        if status:
-            status = utils.Status(int(status))
-        else:
-            status = utils.Status.idle
-        player = utils.Player(
-            owner=user,
-            bot=self.bot,
-            name=name,
-            created_at=created,
-            explored=list(map(self.bot.map_manager.get_map, explored)),
-            status=status,
-            exp=exp,
-            next_map=await self.bot.redis.get(f"next_map_{user.id}"),
-            compendium=compendium,
-            gold=gold
-        )
-        player.map = map_id
-        pm.players.append(player)
+        try:
+            player, = await pm.load_players([data])
+        except ValueError:
+            return await ctx.send(f"{blobs.BLOB_SAD} I couldn't find you, try again later.")
+        pm.add_player(player)
         log.info("Recovered player %s (%s).", player.name, ctx.author)
         await ctx.send(f"{blobs.BLOB_PARTY} Success! {player.name} has been revived!")
 
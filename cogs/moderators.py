@@ -40,8 +40,9 @@ class Moderator(commands.Cog):
 
     @commands.command(hidden=True)
     async def addsupporter(self, ctx, *, user: discord.User):
-        if not await self.bot.db.fetchrow("SELECT * FROM supporters WHERE userid=$1;", user.id):
+        if user.id not in self.bot.supporters:
             await self.bot.db.execute("INSERT INTO supporters VALUES ($1);", user.id)
+            self.bot.supporters[user.id] = utils.SupporterSettings(user.id, None, 16777215)
             g = self.bot.get_guild(561390061963182132)
             m = g.get_member(user.id)
             if m:
@@ -53,12 +54,22 @@ class Moderator(commands.Cog):
     @commands.command(hidden=True)
     async def supporters(self, ctx):
         n = []
-        for user in await self.bot.db.fetch("SELECT userid FROM supporters;"):
-            uid = user['userid']
+        for uid in self.bot.supporters:
             u = self.bot.get_user(uid)
             n.append(f"{u or 'uncached'}")
         await ctx.send(", ".join(n))
 
+    @commands.command(hidden=True)
+    async def reloadenemies(self, ctx):
+        await self.bot.enemy_manager.load_enemies()
+        await ctx.send(f"Loaded {len(self.bot.enemy_manager.enemies)} enemies.")
+
+    @commands.command(hidden=True)
+    async def reloadpersonas(self, ctx):
+        cog = self.bot.get_cog("Battle")
+        await cog.refresh_catalog()
+        await ctx.send(f"Loaded {len(cog.catalog)} personas.")
+
     @commands.command(hidden=True)
     async def channelignore(self, ctx, *, num: int):
         if await self.bot.redis.sismember("channel_ignore", str(num)):
@@ -163,10 +174,7 @@ class Moderator(commands.Cog):
         if not player:
             log.warning("%s / %s: No player for %s", ctx.message.clean_content, ctx.author, member)
             return await ctx.message.add_reaction(blobs.BLOB_CROSS)
-        if await player.is_travelling():
-            await self.bot.redis.set(f"travelling_{member.id}", "0", expire=1)
-        elif await player.is_exploring():
-            await self.bot.redis.set(f"exploring_{member.id}", "0", expire=1)
+        await player.finish_now()
         if not ignore_reaction:
             await ctx.message.add_reaction(blobs.BLOB_TICK)
 
@@ -256,11 +264,47 @@ class Moderator(commands.Cog):
         table.set_columns(["owner", "ttl", "type"])
         for p in self.bot.player_manager.players:
             if await p.is_travelling():
-                table.add_row([str(p.owner), await self.bot.redis.ttl(f"travelling_{p.owner.id}"), "travelling"])
+                table.add_row([p.owner_display, await p.travel_time(), "travelling"])
             elif await p.is_exploring():
-                table.add_row([str(p.owner), await self.bot.redis.ttl(f"exploring_{p.owner.id}"), "exploring"])
+                table.add_row([p.owner_display, await p.explore_time(), "exploring"])
+        await ctx.send(f"```\n{table.render()}\n```")
+
+    @commands.command(hidden=True)
+    async def spawntable(self, ctx, *, map):
+        _map = self.bot.map_manager.resolve_map(map)
+        if not _map:
+            return await ctx.send("Unknown map.")
+        spawns = self.bot.enemy_manager.spawns_for(_map)
+        if not spawns.count:
+            return await ctx.send(f"There are no enemies in {_map}.")
+        table = utils.TabularData()
+        table.set_columns(["enemy", "tier", "weight", "chance"])
+        for enemy, chance in spawns.table.probabilities().items():
+            table.add_row([enemy.name, enemy.tier, enemy.weights[_map.id], f"{chance:.1%}"])
         await ctx.send(f"```\n{table.render()}\n```")
 
+    @commands.command(hidden=True)
+    async def flushstats(self, ctx):
+        pm = self.bot.player_manager
+        stats = pm.flush_stats
+        dirty = sum(1 for p in pm.players if p.is_dirty)
+        await ctx.send(f"```\nFlushes: {stats['flushes']}\nRows written: {stats['rows']}\n"
+                       f"Total time: {stats['seconds']:.3f}s\nLast flush: {pm.last_flush_latency:.3f}s\n"
+                       f"Waiting: {dirty} players\n```")
+
+    @commands.command(hidden=True)
+    async def cachestats(self, ctx):
+        cache = self.bot.player_manager.profile_cache
+        images = self.bot.player_manager.image_cache
+        pool = self.bot.player_manager.render_pool
+        await ctx.send(f"```\nProfiles: {len(cache)} ({cache.size:,} / {cache.max_bytes:,} bytes)\n"
+                       f"Hits: {cache.hits}\nMisses: {cache.misses}\nShared renders: {cache.shared}\n"
+                       f"Evictions: {cache.evictions}\nWaiting renders: {pool.waiting}\n"
+                       f"Rejected renders: {pool.rejected}\n\n"
+                       f"Images: {len(images)} ({images.size:,} / {images.max_bytes:,} bytes)\n"
+                       f"Hits: {images.hits}\nDisk hits: {images.disk_hits}\nDownloads: {images.misses}\n"
+                       f"On disk: {images.disk_size:,} / {images.max_disk_bytes:,} bytes\n```")
+
     @commands.command(hidden=True)
     async def logs(self, ctx):
         filename = f"logs/{self.bot.init.strftime('%Y-%m-%d_%H.%M.%S.%f')}.log"
@@ -19,7 +19,7 @@ class Supporter(commands.Cog):
         self.dump: discord.TextChannel = None
 
     async def cog_check(self, ctx):
-        if ctx.author in await self.bot.get_supporters():
+        if ctx.author.id in self.bot.supporters:
             return True
         raise utils.NotSupporter
 
@@ -27,6 +27,7 @@ class Supporter(commands.Cog):
     async def customreset(self, ctx):
         """Resets your custom background and colour to the defaults."""
         await self.bot.db.execute("UPDATE supporters SET cstmbg=NULL, textcol=16777215 WHERE userid=$1;", ctx.author.id)
+        self.bot.supporters[ctx.author.id] = utils.SupporterSettings(ctx.author.id, None, 16777215)
         await ctx.send(f"Done! {blobs.BLOB_THUMB}")
 
     @commands.command()
@@ -47,6 +48,7 @@ class Supporter(commands.Cog):
         res = await self.resize(image)
         url = await self.dump_image(res)
         await self.bot.db.execute("UPDATE supporters SET cstmbg=$2 WHERE userid=$1;", ctx.author.id, url)
+        self.bot.supporters[ctx.author.id] = self.bot.supporters[ctx.author.id]._replace(cstmbg=url)
         await ctx.send(f"{blobs.BLOB_CHEER} Finished!")
 
     @commands.command(aliases=['textcolor', 'textcolour', 'txtcol'])
@@ -55,6 +57,7 @@ class Supporter(commands.Cog):
 
         Only supporters may use this command."""
         await self.bot.db.execute("UPDATE supporters SET textcol=$1 WHERE userid=$2;", colour.value, ctx.author.id)
+        self.bot.supporters[ctx.author.id] = self.bot.supporters[ctx.author.id]._replace(textcol=colour.value)
         await ctx.send(embed=discord.Embed(color=colour, title="Done!"))
 
     async def dump_image(self, image):
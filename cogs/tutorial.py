@@ -4,7 +4,6 @@ it was a pain to set up and i hate it
 """
 
 import asyncio
-import io
 import random
 
 import discord
@@ -78,11 +77,7 @@ async def maps_(ctx, player):
     This wont show maps that are not nearby."""
     pg = utils.EmbedPaginator()
     for _map in player.map.nearby:
-        embed = discord.Embed(color=_map._raw['colour'], description=_map.description)
-        embed.set_author(name=_map.name)
-        embed.add_field(name="ID", value=str(_map.id))
-        embed.add_field(name="Density", value=str(_map.density))
-        pg.add_page(embed)
+        pg.add_page(ctx.bot.map_manager.map_embed(_map, detailed=False))
     inf = utils.EmbedInterface(ctx.bot, pg, ctx.author)
     await inf.send_to(ctx)
     return inf.message
@@ -93,7 +88,7 @@ async def encounter(ctx, player):
     enemies = em.enemies_for(ctx.bot.map_manager.resolve_map("abel beach"))
     enemy = random.choice(enemies)
     exp = random.randint((enemy.tier ** 3) // 8, (enemy.tier ** 3) // 4) + 1
-    gold = random.randint(enemy.tier * 2, enemy.tier * 6)
+    gold = random.randint(*utils.gold_range(enemy.tier))
     player.exp += exp
     player.gold += gold
     await ctx.send(f"{blobs.BLOB_CHEER} You encountered **{enemy.name}** and defeated it!\n"
@@ -163,16 +158,15 @@ async def tutorial(ctx: utils.EpicContext):
     await asyncio.sleep(2)
     await ctx.send("Exploring tends to take a lot longer than travelling."
                    " I'll speed you up again for the sake of this tutorial.")
-    player.explored_maps.append(player.map)
+    player.add_explored(player.map)
     await asyncio.sleep(2)
     await ctx.send(f"{blobs.BLOB_PARTY} {player.name} has finished exploring Abel Beach!")
     await asyncio.sleep(2)
     await ctx.send(f"Side note, you can use `{ctx.prefix}profile` to view your current profile.")
     await bot.wait_for("message", check=seventh_check(ctx))
     await ctx.trigger_typing()
-    async with bot.session.get(str(ctx.author.avatar_url_as(format="png", size=256))) as get:
-        avy = io.BytesIO(await get.read())
-    profile = await bot.player_manager.profile_for(avy, player)
+    avy = await bot.player_manager.image_cache.avatar(ctx.author)
+    profile = await bot.player_manager.profile_for(avy, bot.player_manager.profile_lines(player))
     file = discord.File(profile, "profile.png")
     await ctx.send(file=file)
     await asyncio.sleep(2)
@@ -205,7 +199,7 @@ async def tutorial(ctx: utils.EpicContext):
                    f"it'll show it's name in a table.")
     await bot.wait_for("message", check=ninth_check(ctx))
     comp = player.compendium
-    comp.bits[enemy.id-1] = 1
+    comp.record_enemy(enemy)
     render = comp.format()
     await ctx.send(f"```\n{render}\n```")
     await asyncio.sleep(2)
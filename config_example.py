@@ -12,3 +12,18 @@ OWNERS = []  # list of user ids (ints)
 NOOT = "image url"
 DBL = "dbl token"
 DBL_AUTH = "p much whatever you want"
+FLUSH_INTERVAL = 60  # seconds between saving changed players
+LEADERBOARD_EXCLUDE = [455289384187592704]  # user ids to hide from the leaderboards
+PROFILE_CACHE_SIZE = 32 * 1024 * 1024  # bytes of rendered profiles to keep
+PROFILE_WORKERS = 0  # processes used to draw profiles, 0 draws them in threads instead
+PROFILE_CONCURRENCY = None  # profiles that can be drawing at once, None for one per worker (4 with threads)
+PROFILE_QUEUE_SIZE = 16  # profiles that can wait to be drawn, more are turned away until there's room
+IMAGE_CACHE_SIZE = 64 * 1024 * 1024  # bytes of avatars / backgrounds to keep in memory
+IMAGE_CACHE_DIR = None  # or a directory to also keep them on disk
+IMAGE_CACHE_DISK_SIZE = 256 * 1024 * 1024  # bytes of images to keep in IMAGE_CACHE_DIR
+# Compiled world snapshot, build it with "python -m tools.build_world".
+# The map files are used instead while any of them are newer than it.
+WORLD_SNAPSHOT = "world.bin"
+ROUTE_CACHE_SIZE = 256  # start maps to keep quicktravel routes for
+# How often, in seconds, to check maps/ for changed files and apply them. 0 turns it off.
+MAP_RELOAD_INTERVAL = 10
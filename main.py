@@ -80,8 +80,9 @@ class Adventure(commands.Bot):
         self.in_tutorial             = []
         self.unload_complete         = []
 
-        self.blacklist = {}
-        self.prefixes  = {}
+        self.blacklist  = {}
+        self.prefixes   = {}
+        self.supporters = {}  # user id: utils.SupporterSettings
 
         self.add_check(self.blacklist_check)
         self.prepare_extensions()
@@ -122,8 +123,7 @@ class Adventure(commands.Bot):
         return super().dispatch(event, *args, **kwargs)
 
     async def get_supporters(self):
-        return [self.get_user(u['userid']) for u in
-                await self.db.fetch("SELECT userid FROM supporters;")]
+        return [self.get_user(u) for u in self.supporters]
 
     def prepare_extensions(self):
         for extension in EXTENSIONS:
@@ -188,6 +188,9 @@ class Adventure(commands.Bot):
                     # await cur.execute("DELETE FROM blacklist WHERE userid=$1;", userid)
                 self.blacklist[userid] = reason
                 LOG.info("User %s (%s) is blacklisted.", self.get_user(userid), userid)
+            for userid, cstmbg, textcol in await cur.fetch("SELECT userid, cstmbg, textcol FROM supporters;"):
+                self.supporters[userid] = utils.SupporterSettings(userid, cstmbg, textcol)
+            LOG.info("Loaded %s supporters.", len(self.supporters))
 
         self.prepared.set()
         LOG.info("Setup complete. Listening to commands on prefix \"%s\".", config.PREFIX)
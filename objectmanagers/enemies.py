@@ -1,5 +1,5 @@
+import collections
 import logging
-import math
 import random
 from typing import *
 
@@ -11,6 +11,11 @@ import utils
 
 log = logging.getLogger("Adventure.EnemyManager")
 
+# the enemies found in one map, with the numbers encounter needs worked out up front
+# table is a utils.AliasTable of the enemies, weighted by their spawn weights in the map
+MapEnemies = collections.namedtuple("MapEnemies", "enemies strongest count table")
+NO_ENEMIES = MapEnemies((), 0, 0, None)
+
 
 class EnemyManager(commands.Cog, name="Enemies"):
     """
@@ -19,6 +24,7 @@ class EnemyManager(commands.Cog, name="Enemies"):
     def __init__(self, bot):
         self.bot = bot
         self.enemies: List[utils.Enemy] = []
+        self._by_map: Dict[int, MapEnemies] = {}
 
     def __repr__(self):
         return "<EnemyManager total: {0}>".format(len(self.enemies))
@@ -32,7 +38,7 @@ class EnemyManager(commands.Cog, name="Enemies"):
         await ctx.send("https://megamitensei.fandom.com/wiki/" + name)
 
     @commands.command(ignore_extra=False)
-    @commands.cooldown(5, 120, commands.BucketType.user)
+    @commands.cooldown(*utils.ENCOUNTER_COOLDOWN, commands.BucketType.user)
     async def encounter(self, ctx):
         """Searches for an enemy to fight within the area.
 
@@ -58,13 +64,12 @@ class EnemyManager(commands.Cog, name="Enemies"):
         if not player.has_explored(player.map):
             ctx.command.reset_cooldown(ctx)
             return await ctx.send("{} You must explore the current map first!".format(blobs.BLOB_ARMSCROSSED))
-        enemies = self.enemies_for(player.map)
-        if not enemies:
+        spawns = self.spawns_for(player.map)
+        if not spawns.count:
             raise RuntimeError(f"No enemies were discovered for map {player.map!r}")
-        strongest = max(enemies, key=lambda e: e.tier)
-        chance = 100 + ((len(enemies) - strongest.tier) - player.level)
-        if random.randint(0, 100) < chance:
-            enemy = random.choice(enemies)
+        chance = utils.encounter_threshold(spawns.count, spawns.strongest, player.level)
+        if random.randint(*utils.ENCOUNTER_ROLL) < chance:
+            enemy = spawns.table.sample()
             if not player.compendium.is_enemy_recorded(enemy) and \
                     await ctx.warn(f"{blobs.BLOB_PEEK} You encountered **{enemy.name}**. Would you like to try and"
                                    f" {blobs.BLOB_TICK} capture it, or {blobs.BLOB_CROSS} defeat it?"):
@@ -73,8 +78,8 @@ class EnemyManager(commands.Cog, name="Enemies"):
                 capture = False
             if enemy.defeat(player.level):
                 if not capture:
-                    exp = math.ceil(enemy.tier ** 2 / 2.5)
-                    gold = random.randint(enemy.tier * 2, enemy.tier * 6)
+                    exp = utils.defeat_exp(enemy.tier)
+                    gold = random.randint(*utils.gold_range(enemy.tier))
                     player.exp += exp
                     player.gold += gold
                     await ctx.send(f"{blobs.BLOB_CHEER} You encountered **{enemy.name}** and defeated it!\n"
@@ -85,7 +90,7 @@ class EnemyManager(commands.Cog, name="Enemies"):
             else:
                 if not capture:
                     player.map = 0
-                    gold = random.randint(enemy.tier * 2, enemy.tier * 6)
+                    gold = random.randint(*utils.gold_range(enemy.tier))
                     player.gold = max(0, player.gold - gold)
                     await ctx.send(f"{blobs.BLOB_INJURED} You encountered **{enemy.name}** and failed to defeat it!"
                                    f"\nYou were knocked out, lost {gold} coins and was magically sent back to Abel.")
@@ -99,13 +104,39 @@ class EnemyManager(commands.Cog, name="Enemies"):
         await self.bot.prepared.wait()
         if len(self.enemies) > 0:
             return
-        for name, maps, tier, id in await self.bot.db.fetch("SELECT * FROM encounters;"):
-            enemy = utils.Enemy(id=id, name=name, maps=[self.bot.map_manager.resolve_map(m) for m in maps], tier=tier)
-            self.enemies.append(enemy)
+        await self.load_enemies()
+
+    async def load_enemies(self):
+        """(Re)loads the enemies from the encounters table, and rebuilds the map index.
+        Call this after changing encounters."""
+        rows = await self.bot.db.fetch("SELECT id, name, map_ids, tier_requirement, spawn_weights "
+                                       "FROM encounters ORDER BY id;")
+        enemies = []
+        by_map = collections.defaultdict(list)
+        for row in rows:
+            weights = row['spawn_weights']
+            if weights is not None and not utils.valid_spawn_weights(row['map_ids'], weights):
+                log.warning("Enemy %s has invalid spawn weights %s, ignoring them.", row['name'], weights)
+                weights = None
+            enemy = utils.Enemy(id=row['id'], name=row['name'], tier=row['tier_requirement'],
+                                maps=[self.bot.map_manager.resolve_map(m) for m in row['map_ids']],
+                                weights=dict(zip(row['map_ids'], weights or [1.0] * len(row['map_ids']))))
+            enemies.append(enemy)
+            # keyed by id, so maps added by a hot reload later on still find their enemies
+            for map_id in enemy.weights:
+                by_map[map_id].append(enemy)
             log.info("Prepared enemy %r", enemy)
+        self.enemies = enemies
+        self._by_map = {map_id: MapEnemies(tuple(e), max(x.tier for x in e), len(e),
+                                           utils.AliasTable(e, [x.weights[map_id] for x in e]))
+                        for map_id, e in by_map.items()}
+        log.info("Loaded %s enemies across %s maps.", len(enemies), len(self._by_map))
+
+    def spawns_for(self, map: utils.Map) -> MapEnemies:
+        return self._by_map.get(map.id, NO_ENEMIES)
 
-    def enemies_for(self, map: utils.Map) -> List[utils.Enemy]:
-        return list(filter(lambda e: map in e.maps, self.enemies))
+    def enemies_for(self, map: utils.Map) -> Tuple[utils.Enemy, ...]:
+        return self.spawns_for(map).enemies
 
 
 def setup(bot):
@@ -1,13 +1,14 @@
 # -> Builtin modules
+import asyncio
 import collections
 import logging
 import os
+import time
 from typing import List
 
 # -> Pip packages
 import discord
 from discord.ext import commands
-from discord.utils import find
 
 # -> Local files
 import blobs
@@ -24,24 +25,53 @@ except ImportError:
 
 class MapManager(commands.Cog, name="Maps"):
     """Makes sure the maps are working properly, and some other stuff."""
-    __slots__ = ("bot", "_maps")
+    __slots__ = ("bot", "_maps", "_by_id", "_by_name", "_names", "_adjacent", "_snapshot", "_sources",
+                 "_watch_task", "_embeds", "_all_pages")
     _ignore = (-1, 696969)
 
     def __init__(self, bot):
         self.bot = bot
         self._maps: List[utils.Map] = []
+        self._by_id = {}
+        self._by_name = {}  # case folded name -> Map
+        self._names = utils.TrigramIndex()
+        self._adjacent = {}  # map id -> nearby maps, least dense first
+        self._snapshot = None
+        self._sources = {}  # file name -> (mtime, id of the map loaded from it)
+        self._embeds = {}  # (map id, detailed) -> embed payload, see map_embed
+        self._all_pages = None  # payloads for "maps all"
         self.prepare_maps()
         self._graph = utils.Graph()
-        for map in self.maps:
-            for m in map.nearby:
-                self._graph.add_map(map.id, m.id, map.density + m.density)
-        self.dj = utils.djisktra
+        if self._snapshot is not None:
+            for from_id, to_id, weight in self._snapshot.edges():
+                self._graph.add_map(from_id, to_id, weight)
+        else:
+            for map in self.maps:
+                for m in map.nearby:
+                    self._graph.add_map(map.id, m.id, map.density + m.density)
+        self._index_adjacency()
+        # routes are found (or read from the snapshot) per start map as they're needed
+        self.router = utils.Router(self._graph, max_tables=getattr(self.bot.config, "ROUTE_CACHE_SIZE", 256),
+                                   loader=self._snapshot and self._snapshot.route_table)
+        self.reload_interval = getattr(self.bot.config, "MAP_RELOAD_INTERVAL", 10)
+        self._watch_task = self.bot.loop.create_task(self.watch_maps()) if self.reload_interval > 0 else None
 
     def __repr__(self):
         return "<MapManager total: {0}>".format(len(self._maps))
 
     def cog_unload(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
         del self._maps[:]
+        self._by_id.clear()
+        self._by_name.clear()
+        self._names.clear()
+        self._adjacent.clear()
+        self._clear_embeds()
+        self.router.clear()
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
 
     # -- Commands -- #
 
@@ -54,27 +84,18 @@ class MapManager(commands.Cog, name="Maps"):
             return await ctx.invoke(self.all_)
         pg = utils.EmbedPaginator()
         for _map in player.map.nearby:
-            embed = discord.Embed(color=_map._raw['colour'], description=_map.description)
-            embed.set_author(name=_map.name)
-            embed.add_field(name="ID", value=str(_map.id))
-            embed.add_field(name="Density", value=str(_map.density))
-            pg.add_page(embed)
+            pg.add_page(self.map_embed(_map, detailed=False))
         inf = utils.EmbedInterface(self.bot, pg, ctx.author)
         await inf.send_to(ctx)
 
     @maps_.command(name="all")
     async def all_(self, ctx):
         """View all maps, regardless if they are nearby."""
+        if self._all_pages is None:
+            self._all_pages = [self._embed_data(_map, True) for _map in self.maps if _map.id not in self._ignore]
         pg = utils.EmbedPaginator()
-        for _map in self.maps:
-            if _map.id in self._ignore:
-                continue
-            embed = discord.Embed(color=_map._raw['colour'], description=_map.description)
-            embed.set_author(name=_map.name + (' (Safe)' if _map.is_safe else ''))
-            embed.add_field(name="ID", value=str(_map.id))
-            embed.add_field(name="Density", value=str(_map.density))
-            embed.add_field(name="Nearby Maps", value="`" + "`, `".join(map(str, _map.nearby)) + "`", inline=False)
-            pg.add_page(embed)
+        for data in self._all_pages:
+            pg.add_page(discord.Embed.from_dict(data))
         inf = utils.EmbedInterface(self.bot, pg, ctx.author)
         await inf.send_to(ctx)
 
@@ -86,12 +107,7 @@ class MapManager(commands.Cog, name="Maps"):
             return await ctx.send(f"You don't have a player! {blobs.BLOB_PLSNO} Create one with `{ctx.prefix}create`!")
         pg = utils.EmbedPaginator()
         for _map in player.explored_maps:
-            embed = discord.Embed(colour=_map._raw['colour'], description=_map.description)
-            embed.set_author(name=_map.name + (' (Safe)' if _map.is_safe else ''))
-            embed.add_field(name="ID", value=str(_map.id))
-            embed.add_field(name="Density", value=str(_map.density))
-            embed.add_field(name="Nearby Maps", value="`" + "`, `".join(map(str, _map.nearby)) + "`", inline=False)
-            pg.add_page(embed)
+            pg.add_page(self.map_embed(_map))
         inf = utils.EmbedInterface(self.bot, pg, ctx.author)
         await inf.send_to(ctx)
 
@@ -115,11 +131,12 @@ class MapManager(commands.Cog, name="Maps"):
             ctx.command.reset_cooldown(ctx)
             return await ctx.send(f"{blobs.BLOB_ANGERY} You haven't explored {map}!")
         start = player.map
-        path = self.dj(self._graph, start.id, map.id)
-        for mid in path:
-            mm = self.get_map(mid)
-            if not player.has_explored(mm):
-                return await ctx.send(f"{blobs.BLOB_ARMSCROSSED} You must explore {mm} first!")
+        explored = {m.id for m in self._maps if player.has_explored(m)}
+        try:
+            path = self.router.path(start.id, map.id, explored)
+        except IndexError:
+            ctx.command.reset_cooldown(ctx)
+            return await ctx.send(f"{blobs.BLOB_ARMSCROSSED} You haven't explored a way to {map} yet!")
         cost = sum(self.get_map(p).density for p in path)
         if player.gold < cost:
             ctx.command.reset_cooldown(ctx)
@@ -154,7 +171,7 @@ class MapManager(commands.Cog, name="Maps"):
         elif isinstance(item, bytes) and item.lstrip(b"-").isdigit():
             return self.get_map(int(item))
         elif isinstance(item, str):
-            return find(lambda m: m.name.lower() == item.lower(), self.maps)
+            return self._by_name.get(item.casefold())
         elif isinstance(item, utils.Map):
             return item
         elif item is None:
@@ -171,25 +188,41 @@ class MapManager(commands.Cog, name="Maps"):
         # self._add_map_nearby(_map, *list(map(self.get_map, data['nearby'])))
         _map._nearby = data['nearby']
         self._maps.append(_map)
+        self._by_id[_id] = _map
+        self._by_name.setdefault(_map.name.casefold(), _map)
+        if _id not in self._ignore:
+            self._names.add(_map.name)
+        return _map
 
-    def walk_paths(self, start):
-        seen = [start.id]
+    def walk_paths(self, start, *, max_depth=None, max_cost=None):
+        """Lazily walks outwards from `start`, breadth first.
 
-        def get_nearby(map_id):
-            l = filter(lambda x: map_id in x.nearby, self._maps)
-            return sorted(l, key=lambda x: x.density)
+        Yields the path (a list of maps, starting with `start`) to each reachable map once,
+        using the fewest hops, and the cheapest nearby maps first when there's a tie.
+        Paths longer than `max_depth` hops, or with a total travel weight above `max_cost`, aren't followed."""
+        seen = {start.id}
+        queue = collections.deque([([start], 0)])
+        while queue:
+            path, cost = queue.popleft()
+            yield path
+            if max_depth is not None and len(path) > max_depth:
+                continue
+            current = path[-1]
+            for nearby in self._adjacent.get(current.id, ()):
+                if nearby.id in seen:
+                    continue
+                weight = cost + self._graph.weights[(current.id, nearby.id)]
+                if max_cost is not None and weight > max_cost:
+                    continue
+                seen.add(nearby.id)
+                queue.append(([*path, nearby], weight))
 
-        l = collections.deque([[start]])
-        while True:
-            try:
-                x = l.popleft()
-                yield x
-                seen.append(x[-1].id)
-                for y in get_nearby(x[-1].id):
-                    if y.id not in seen:
-                        l.append([*x, y])
-            except IndexError:
-                raise StopIteration
+    def _index_adjacency(self, maps=None):
+        if maps is None:
+            self._adjacent = {m.id: tuple(sorted(m.nearby, key=lambda x: x.density)) for m in self._maps}
+            return
+        for _map in maps:
+            self._adjacent[_map.id] = tuple(sorted(_map.nearby, key=lambda x: x.density))
 
     @staticmethod
     def _add_map_nearby(map1: utils.Map, *maps: utils.Map):
@@ -199,22 +232,214 @@ class MapManager(commands.Cog, name="Maps"):
             map1.nearby.append(_map)
             _map.nearby.append(map1)
 
+    def _embed_data(self, _map, detailed):
+        try:
+            return self._embeds[_map.id, detailed]
+        except KeyError:
+            pass
+        embed = discord.Embed(color=_map._raw['colour'], description=_map.description)
+        if detailed:
+            embed.set_author(name=_map.name + (' (Safe)' if _map.is_safe else ''))
+        else:
+            embed.set_author(name=_map.name)
+        embed.add_field(name="ID", value=str(_map.id))
+        embed.add_field(name="Density", value=str(_map.density))
+        if detailed:
+            embed.add_field(name="Nearby Maps", value="`" + "`, `".join(map(str, _map.nearby)) + "`", inline=False)
+        data = self._embeds[_map.id, detailed] = embed.to_dict()
+        return data
+
+    def map_embed(self, _map, *, detailed=True) -> discord.Embed:
+        """Returns the embed describing a map, built from a cached payload.
+
+        The payload never has a footer, so paginators adding page numbers
+        don't change what later calls get.
+        Pass detailed=False to leave out the safe tag and the nearby maps."""
+        return discord.Embed.from_dict(self._embed_data(_map, detailed))
+
+    def _clear_embeds(self):
+        self._embeds.clear()
+        self._all_pages = None
+
     def get_map(self, map_id: int):
-        return find(lambda m: m.id == map_id, self._maps)
+        return self._by_id.get(map_id)
+
+    def close_matches(self, name: str, count=3) -> List[str]:
+        """Returns the names of up to `count` maps with names similar to `name`."""
+        return self._names.search(name, count)
 
     def prepare_maps(self):
-        for _map in sorted(os.listdir("maps"), key=lambda i: i.lower()):
+        path = getattr(self.bot.config, "WORLD_SNAPSHOT", "world.bin")
+        if path and utils.WorldSnapshot.is_fresh(path, "maps"):
+            try:
+                self._snapshot = utils.WorldSnapshot(path)
+            except (OSError, ValueError) as e:
+                log.error("Couldn't load the world snapshot, using the map files instead. [%s: %s]",
+                          type(e).__name__, str(e))
+        elif path and os.path.exists(path):
+            log.warning("The world snapshot is older than the map files, using the map files instead.")
+        if self._snapshot is not None:
+            start = time.perf_counter()
+            # the snapshot was built from every map file, in the same order
+            sources = sorted(self._scan_sources().items(), key=lambda i: i[0].lower())
+            for (file, mtime), data in zip(sources, self._snapshot.maps()):
+                self._add_map(**data)
+                self._sources[file] = (mtime, data["id"])
+            # already linked both ways when the snapshot was built,
+            # _nearby keeps the maps each file lists itself for reloading
+            for from_id, to_id, _ in self._snapshot.edges():
+                self._by_id[from_id].nearby.append(self._by_id[to_id])
+            log.info("Loaded %s maps from %s in %.2fms.", len(self._maps), path,
+                     (time.perf_counter() - start) * 1000)
+            return
+
+        for _map, mtime in sorted(self._scan_sources().items(), key=lambda i: i[0].lower()):
             with open("maps/" + _map) as f:
                 try:
                     _json = json.load(f)
-                    self._add_map(**_json)
+                    added = self._add_map(**_json)
                 except Exception as e:
+                    added = None
                     log.error("Map %s is malformed. [%s: %s]", _map, type(e).__name__, str(e))
+            self._sources[_map] = (mtime, added and added.id)
 
         for _map in self.maps:
             self._add_map_nearby(_map, *list(map(self.get_map, _map._nearby)))
             log.info("Prepared map %s.", _map)
 
+    # -- Hot reloading -- #
+
+    @staticmethod
+    def _scan_sources():
+        return utils.map_sources("maps")
+
+    async def watch_maps(self):
+        while await asyncio.sleep(self.reload_interval, True):
+            try:
+                self.reload_changed()
+            except Exception as e:
+                log.critical("Failed to reload maps.\n%s: %s", type(e).__name__, str(e))
+
+    def reload_changed(self) -> int:
+        """Re-reads the map files that changed since they were loaded, and applies them.
+
+        Existing Map objects are updated in place, so players and enemies keep pointing at them.
+        Only the changed maps and their neighbours are relinked.
+        Returns the amount of maps that were added, changed or removed."""
+        current = self._scan_sources()
+        changed = sorted((f for f, mtime in current.items() if self._sources.get(f, (None,))[0] != mtime),
+                         key=str.lower)
+        removed = [f for f in self._sources if f not in current]
+        if not changed and not removed:
+            return 0
+        touched = set()  # ids of the maps that need relinking
+        applied = 0
+        for file in removed:
+            _, map_id = self._sources.pop(file)
+            if map_id is not None:
+                touched |= self._remove_map(map_id)
+                applied += 1
+                log.warning("Map file %s was removed, unloaded map %s.", file, map_id)
+        owners = {map_id: file for file, (_, map_id) in self._sources.items()}
+        for file in changed:
+            old_id = self._sources.get(file, (None, None))[1]
+            try:
+                with open("maps/" + file) as f:
+                    data = json.load(f)
+                map_id = int(data["id"])
+                if owners.get(map_id, file) != file:
+                    raise ValueError(f"map id {map_id} is already used by {owners[map_id]}")
+            except Exception as e:
+                log.error("Map %s is malformed, keeping the loaded version. [%s: %s]", file, type(e).__name__, str(e))
+                self._sources[file] = (current[file], old_id)
+                continue
+            if old_id is not None and old_id != map_id:
+                touched |= self._remove_map(old_id)
+                log.warning("Map file %s changed its id from %s to %s.", file, old_id, map_id)
+            _map = self.get_map(map_id)
+            if _map is None:
+                _map = self._add_map(**data)
+                log.info("Added map %s from %s.", _map, file)
+            else:
+                touched |= self._patch_map(_map, data)
+            touched.add(map_id)
+            applied += 1
+            owners[map_id] = file
+            self._sources[file] = (current[file], map_id)
+        if touched:
+            self._relink(touched)
+        return applied
+
+    def _patch_map(self, _map, data) -> set:
+        """Updates a Map from new JSON data. Returns the ids of its old nearby maps."""
+        diff = ["{0} {1!r} -> {2!r}".format(key, _map._raw.get(key), data.get(key))
+                for key in sorted(_map._raw.keys() | data.keys()) if _map._raw.get(key) != data.get(key)]
+        if diff:
+            log.info("Map %s changed: %s", _map, ", ".join(diff))
+        old = self._unlink(_map)
+        self._unindex_name(_map)
+        _map.__init__(**data)
+        _map._nearby = data['nearby']
+        self._by_name.setdefault(_map.name.casefold(), _map)
+        if _map.id not in self._ignore:
+            self._names.add(_map.name)
+        return old
+
+    def _remove_map(self, map_id) -> set:
+        """Unloads a map. Returns its id and the ids of its old nearby maps."""
+        _map = self._by_id.pop(map_id, None)
+        if _map is None:
+            return set()
+        self._maps.remove(_map)
+        self._unindex_name(_map)
+        self._adjacent.pop(map_id, None)
+        return self._unlink(_map) | {map_id}
+
+    def _unindex_name(self, _map):
+        key = _map.name.casefold()
+        if self._by_name.get(key) is _map:
+            del self._by_name[key]
+        self._names.discard(_map.name)
+
+    @staticmethod
+    def _unlink(_map) -> set:
+        old = {m.id for m in _map.nearby}
+        for other in _map.nearby:
+            other.nearby = [m for m in other.nearby if m.id != _map.id]
+        _map.nearby = []
+        return old
+
+    def _relink(self, map_ids):
+        """Re-adds the nearby links, graph edges and adjacency of the maps in `map_ids`,
+        then drops the cached routes the changed links could affect."""
+        maps = [m for m in map(self.get_map, map_ids) if m is not None]
+        for _map in maps:
+            self._add_map_nearby(_map, *map(self.get_map, _map._nearby))
+        for other in self._maps:
+            for _map in maps:
+                if _map.id in other._nearby:
+                    self._add_map_nearby(other, _map)
+        before = self._graph.edges_of(map_ids)
+        for map_id in map_ids:
+            self._graph.remove_node(map_id)
+        for _map in maps:
+            for m in _map.nearby:
+                if (_map.id, m.id) not in self._graph.weights:
+                    self._graph.add_map(_map.id, m.id, _map.density + m.density)
+        after = self._graph.edges_of(map_ids)
+        self._index_adjacency({n.id: n for m in maps for n in (m, *m.nearby)}.values())
+        # neighbours show the changed maps names too
+        self._clear_embeds()
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+        # the cached routes are copies, they outlive the snapshot
+        self.router.loader = None
+        changes = {edge: (before.get(edge), after.get(edge)) for edge in before.keys() | after.keys()
+                   if before.get(edge) != after.get(edge)}
+        dropped = self.router.update(changes)
+        log.info("%s changed links dropped %s cached route tables.", len(changes) // 2, dropped)
+
 
 def setup(bot):
     cog = MapManager(bot)
@@ -1,12 +1,12 @@
 # -> Builtin modules
 import asyncio
+import collections
 import copy
-import difflib
 import io
 import logging
 import math
-import operator
 import random
+import time
 import typing
 from datetime import datetime
 
@@ -14,7 +14,6 @@ from datetime import datetime
 import discord
 import humanize
 from discord.ext import commands
-from PIL import Image, ImageDraw, ImageFont
 
 # -> Local files
 import utils
@@ -22,27 +21,38 @@ import blobs
 
 log = logging.getLogger("Adventure.PlayerManager")
 
+HYDRATE_BATCH = 500
+
 
 class PlayerManager(commands.Cog, name="Players"):
     """Manages and handles everything to do with the Player."""
     def __init__(self, bot):
         self.bot = bot
-        self.players = list()
+        self.players = utils.PlayerRegistry()
+        self.guild_index = utils.GuildIndex()
         self.unload_event = asyncio.Event()
         self.bot.unload_complete.append(self.unload_event)
         self.is_creating = []
-        with open("assets/profile_background.png", "rb") as f:
-            thing = io.BytesIO(f.read())
-            self.background = Image.open(thing)
-            self.background.convert("RGBA")
-        self._font = "assets/Inkfree.ttf"
+        self.render_pool = utils.RenderPool(getattr(self.bot.config, "PROFILE_WORKERS", 0),
+                                            getattr(self.bot.config, "PROFILE_QUEUE_SIZE", 16),
+                                            concurrency=getattr(self.bot.config, "PROFILE_CONCURRENCY", None),
+                                            loop=self.bot.loop)
+        self.image_cache = utils.ImageCache(self.bot.session, loop=self.bot.loop,
+                                            max_bytes=getattr(self.bot.config, "IMAGE_CACHE_SIZE", 64 * 1024 * 1024),
+                                            directory=getattr(self.bot.config, "IMAGE_CACHE_DIR", None),
+                                            max_disk_bytes=getattr(self.bot.config, "IMAGE_CACHE_DISK_SIZE",
+                                                                   256 * 1024 * 1024))
+        self.profile_cache = utils.RenderCache(getattr(self.bot.config, "PROFILE_CACHE_SIZE", 32 * 1024 * 1024))
         self.ignored_channels = []
         self.ignored_guilds = []
+        # user ids that never show up on the leaderboards
+        self.leaderboard_exclude = frozenset(getattr(self.bot.config, "LEADERBOARD_EXCLUDE", [455289384187592704]))
+        self.flush_interval = getattr(self.bot.config, "FLUSH_INTERVAL", 60)
+        # flushes: total flushes, rows: total rows written, seconds: total time spent writing
+        self.flush_stats = collections.Counter()
+        self.last_flush_latency = 0.0
         self._player_flush_task = self.bot.loop.create_task(self.flush_players())
 
-    def font(self, size=35):
-        return ImageFont.truetype(self._font, size)
-
     def __repr__(self):
         return "<PlayerManager total: {0}>".format(len(self.players))
 
@@ -91,7 +101,7 @@ class PlayerManager(commands.Cog, name="Players"):
             log.info("Player \"%s\" was created by \"%s\".", msg, ctx.author)
             player = utils.Player(owner=ctx.author, name=msg, bot=self.bot, created_at=datetime.utcnow())
             await player.save()
-            self.players.append(player)
+            self.add_player(player)
             await ctx.send("{} Success! \"{}\" was sent to map #0 (Abel).".format(blobs.BLOB_PARTY, msg))
         finally:
             self.is_creating.remove(ctx.author.id)
@@ -118,8 +128,7 @@ class PlayerManager(commands.Cog, name="Players"):
             raise utils.NoPlayer
         _map = self.bot.map_manager.resolve_map(destination)
         if not _map:
-            close = difflib.get_close_matches(destination, list(map(operator.attrgetter("name"),
-                                                                    self.bot.map_manager.maps)))
+            close = self.bot.map_manager.close_matches(destination)
             if not close:
                 return await ctx.send("Unknown map. Use `{}maps` to view the available maps.".format(ctx.prefix))
             return await ctx.send(f"Unknown map. Closest matches were: {'`' + '`, `'.join(close) + '`'}")
@@ -240,21 +249,23 @@ class PlayerManager(commands.Cog, name="Players"):
         else:
             hide = False
         await ctx.trigger_typing()
-        async with self.bot.session.get(str(member.avatar_url_as(format="png", size=256))) as get:
-            n = io.BytesIO(await get.read())
-        url = await self.bot.db.fetchval("SELECT cstmbg FROM supporters WHERE userid=$1;", member.id)
-        if url:
-            async with self.bot.session.get(url) as get:
-                bg = io.BytesIO(await get.read())
-        else:
-            bg = None
-        colour = await self.bot.db.fetchval("SELECT textcol FROM supporters WHERE userid=$1;", member.id)
-        if colour is not None:
-            colour = discord.Colour(colour)
+        settings = self.bot.supporters.get(member.id)
+        url = settings.cstmbg if settings else None
+        if settings and settings.textcol is not None:
+            colour = discord.Colour(settings.textcol)
         else:
             colour = discord.Colour.from_rgb(255, 255, 255)
-        profile = await self.profile_for(n, player, hide=hide, custombg=bg, colour=colour)
-        f = discord.File(profile, filename="profile.png")
+        lines = self.profile_lines(player, hide)
+
+        async def render():
+            avatar = await self.image_cache.avatar(member)
+            bg = await self.image_cache.background(url) if url else None
+            profile = await self.profile_for(avatar, lines, custombg=bg, colour=colour)
+            return profile.getvalue()
+
+        key = self.profile_cache.key(member.avatar, lines, url, colour.value)
+        profile = await self.profile_cache.get(key, render)
+        f = discord.File(io.BytesIO(profile), filename="profile.png")
         await ctx.send(file=f)
 
     @commands.command(ignore_extra=False)
@@ -313,10 +324,9 @@ class PlayerManager(commands.Cog, name="Players"):
         headers = ["Name", "Owner", "Level", "Total Caught"]
         table = utils.TabularData()
         table.set_columns(headers)
-        table.add_rows([[p.name, str(p.owner), p.level, sum(p.raw_compendium_data)]
-                        for p in sorted(
-                filter(lambda m: m.owner in ctx.guild.members and m.owner.id != 455289384187592704, self.players),
-                key=lambda m: sum(m.raw_compendium_data), reverse=True)][:count])
+        ids = self.guild_index.members(ctx.guild.id) - self.leaderboard_exclude
+        table.add_rows([[p.name, p.owner_display, p.level, p.compendium.count]
+                        for p in self.players.top_of("caught", ids, count)])
         try:
             await ctx.send(f"```\n{table.render()}\n```")
         except discord.HTTPException:
@@ -328,9 +338,8 @@ class PlayerManager(commands.Cog, name="Players"):
         headers = ["Name", "Owner", "Level", "Total Caught"]
         table = utils.TabularData()
         table.set_columns(headers)
-        table.add_rows([[p.name, str(p.owner), p.level, sum(p.raw_compendium_data)]
-                        for p in sorted(self.players, key=lambda m: sum(m.raw_compendium_data), reverse=True)
-                        if p.owner.id != 455289384187592704][:count])
+        table.add_rows([[p.name, p.owner_display, p.level, p.compendium.count]
+                        for p in self.players.top("caught", count, exclude=self.leaderboard_exclude)])
         try:
             await ctx.send(f"```\n{table.render()}\n```")
         except discord.HTTPException:
@@ -342,9 +351,8 @@ class PlayerManager(commands.Cog, name="Players"):
         headers = ["Name", "Owner", "Experience", "Level"]
         table = utils.TabularData()
         table.set_columns(headers)
-        table.add_rows([[p.name, str(p.owner), p.exp, p.level]
-                        for p in sorted(self.players, key=lambda m: m.exp, reverse=True)
-                        if p.owner.id != 455289384187592704][:count])
+        table.add_rows([[p.name, p.owner_display, p.exp, p.level]
+                        for p in self.players.top("exp", count, exclude=self.leaderboard_exclude)])
         try:
             await ctx.send(f"```\n{table.render()}```")
         except discord.HTTPException:
@@ -360,29 +368,105 @@ class PlayerManager(commands.Cog, name="Players"):
 
     # -- Player Manager stuff -- #
 
+    async def migrate_compendiums(self):
+        """Converts compendiums still stored in the old SMALLINT[] column to the BYTEA bitset."""
+        rows = await self.bot.db.fetch("SELECT owner_id, compendium_data FROM players "
+                                       "WHERE compendium_bits IS NULL AND compendium_data IS NOT NULL;")
+        if not rows:
+            return
+        converted = [(r['owner_id'], utils.Compendium.dump(utils.Compendium.load(r['compendium_data'])))
+                     for r in rows]
+        await self.bot.db.executemany("UPDATE players SET compendium_bits=$2, compendium_data=NULL "
+                                      "WHERE owner_id=$1;", converted)
+        log.info("Migrated %s compendiums to bitsets.", len(converted))
+
     def fetch_players(self):
         return self.bot.db.fetch("SELECT * FROM players;")
 
+    async def load_players(self, rows) -> typing.List[utils.Player]:
+        """Builds players from rows of the players table.
+
+        The redis state for each player is fetched in pipelined batches
+        of HYDRATE_BATCH players, instead of a few round-trips per player."""
+        redis_time = build_time = 0.0
+        rows = [r for r in rows if self._known_owner(r['owner_id'])]
+        players = []
+        for index in range(0, len(rows), HYDRATE_BATCH):
+            chunk = rows[index:index+HYDRATE_BATCH]
+            ids = [r['owner_id'] for r in chunk]
+
+            start = time.perf_counter()
+            values = await self.bot.redis.mget(*[f"status_{i}" for i in ids], *[f"next_map_{i}" for i in ids])
+            statuses = [utils.Status(int(v)) if v else utils.Status.idle for v in values[:len(ids)]]
+            next_maps = values[len(ids):]
+            pipe = self.bot.redis.pipeline()
+            ttls = {}
+            for owner_id, status in zip(ids, statuses):
+                if status is utils.Status.travelling:
+                    ttls[owner_id] = pipe.ttl(f"travelling_{owner_id}")
+                elif status is utils.Status.exploring:
+                    ttls[owner_id] = pipe.ttl(f"exploring_{owner_id}")
+            if ttls:
+                await pipe.execute()
+            now = time.time()
+            deadlines = {i: now + max(0, fut.result()) for i, fut in ttls.items()}
+            redis_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            for data, status, next_map in zip(chunk, statuses, next_maps):
+                owner_id, name, map_id, created, explored, exp, compendium, gold, *_ = data
+                if data['compendium_bits'] is not None:
+                    compendium = data['compendium_bits']
+                player = utils.Player(
+                    owner_id=owner_id,
+                    bot=self.bot,
+                    name=name,
+                    created_at=created,
+                    explored=explored,
+                    status=status,
+                    deadline=deadlines.get(owner_id),
+                    exp=exp,
+                    next_map=next_map,
+                    compendium=compendium,
+                    gold=gold,
+                    map=map_id
+                )
+                players.append(player)
+            build_time += time.perf_counter() - start
+            await asyncio.sleep(0)  # let the gateway breathe between chunks
+
+        log.info("Hydrated %s players. (redis %.3fs, build %.3fs)", len(players), redis_time, build_time)
+        return players
+
+    def _known_owner(self, owner_id):
+        if self.bot.get_user(owner_id):
+            return True
+        log.warning("Unknown user id %s. Skipping initialization. (%s)", owner_id, len(self.bot.users))
+        return False
+
+    def add_player(self, player: utils.Player):
+        """Starts tracking a player, including which guilds they're in."""
+        self.players.add(player)
+        for guild in self.bot.guilds:
+            if guild.get_member(player.owner_id):
+                self.guild_index.add(guild.id, player.owner_id)
+
+    def remove_player(self, player: utils.Player):
+        """Stops tracking a player. Raises KeyError if they weren't loaded."""
+        self.players.remove(player)
+        self.guild_index.remove_user(player.owner_id)
+
+    def index_guild(self, guild: discord.Guild):
+        for member in guild.members:
+            if member.id in self.players:
+                self.guild_index.add(guild.id, member.id)
+
     def get_player(self, user: typing.Union[discord.Member, discord.User]) -> typing.Optional[utils.Player]:
-        return discord.utils.get(self.players, owner=user)
-
-    @utils.async_executor()
-    def profile_for(self, avatar: io.BytesIO, player: utils.Player, hide: bool = False, *, custombg: io.BytesIO = None,
-                    colour: discord.Colour = None):
-        image = Image.open(avatar).convert("RGBA")
-        image = image.resize((256, 256))
-        if not custombg:
-            background = self.background.copy()
-        else:
-            background = Image.open(custombg).convert("RGBA")
-        colour = colour.to_rgb() if colour else (255, 255, 255)
-        background.paste(image, (0, 0), image)
-        draw = ImageDraw.Draw(background)
+        return self.players.get(user.id)
+
+    @staticmethod
+    def profile_lines(player: utils.Player, hide: bool = False) -> typing.Tuple[str, str, str, str]:
         created = humanize.naturaltime(player.created_at)
-        draw.text((5, 255), f"{player.name}\n{player.owner}\nCreated {created}", colour,
-                  self.font())
-        draw.text((265, 0), f"Tier {player.level}\n{player.exp} EXP", colour,
-                  self.font())
         if player.status is utils.Status.idle:
             status = "Idling at"
             pmap = str(player.map) if not hide else "???"
@@ -395,22 +479,55 @@ class PlayerManager(commands.Cog, name="Players"):
         else:
             status = "???"
             pmap = str(player.map) if not hide else "???"
-        draw.text((265, 125), f"{status}\n{pmap}", colour,
-                  self.font())
-        draw.text((265, 205), f"{player.gold:,} G", colour,
-                  self.font())
-        n = io.BytesIO()
-        background.save(n, "png")
-        n.seek(0)
-        return n
+        return (f"{player.name}\n{player.owner_display}\nCreated {created}",
+                f"Tier {player.level}\n{player.exp} EXP",
+                f"{status}\n{pmap}",
+                f"{player.gold:,} G")
+
+    async def profile_for(self, avatar, lines: typing.Tuple[str, str, str, str], *,
+                          custombg=None, colour: discord.Colour = None):
+        """Draws a profile. `avatar` and `custombg` are images from the image cache."""
+        if custombg is not None:
+            custombg = (custombg.width, custombg.height, custombg.tobytes())
+        spec = utils.ProfileSpec(avatar.tobytes(), tuple(lines), custombg,
+                                 colour.to_rgb() if colour else (255, 255, 255))
+        try:
+            return io.BytesIO(await self.render_pool.render(spec))
+        except utils.RenderQueueFull:
+            raise utils.ProfileBusy() from None
+
+    async def flush_dirty(self) -> int:
+        """Saves every player that has changed since their last save, in a single batch.
+        Returns the amount of rows written."""
+        dirty = [p for p in self.players if p.is_dirty]
+        if not dirty:
+            return 0
+        fields = [p._dirty for p in dirty]
+        rows = []
+        for player in dirty:
+            player._dirty = frozenset()
+            rows.append(player.to_row())
+        start = time.perf_counter()
+        try:
+            await self.bot.db.executemany(utils.SAVE_QUERY, rows)
+        except Exception:
+            for player, changed in zip(dirty, fields):
+                player._dirty |= changed
+            raise
+        self.last_flush_latency = time.perf_counter() - start
+        self.flush_stats['flushes'] += 1
+        self.flush_stats['rows'] += len(rows)
+        self.flush_stats['seconds'] += self.last_flush_latency
+        log.debug("Flushed %s players in %.3fs.", len(rows), self.last_flush_latency)
+        return len(rows)
 
     async def flush_players(self):
         await self.bot.prepared.wait()
-        while await asyncio.sleep(3600, True):
-            async with self.bot.db.acquire() as cursor:
-                for p in self.players:
-                    await p.save(cursor=cursor)
-            log.info("Flushed players.")
+        while await asyncio.sleep(self.flush_interval, True):
+            try:
+                await self.flush_dirty()
+            except Exception as e:
+                log.critical("Failed to flush players.\n%s: %s", type(e).__name__, str(e))
 
     # -- Events -- #
 
@@ -419,6 +536,7 @@ class PlayerManager(commands.Cog, name="Players"):
             self._player_flush_task.cancel()
         except asyncio.CancelledError:
             pass
+        self.render_pool.close()
         self.bot.unload_complete.remove(self.unload_event)
 
     @commands.Cog.listener()
@@ -429,42 +547,43 @@ class PlayerManager(commands.Cog, name="Players"):
         # log.debug("INIT")
         self.ignored_channels = list(map(int, await self.bot.redis.smembers("channel_ignore")))
         self.ignored_guilds = list(map(int, await self.bot.redis.smembers("guild_ignore")))
-        for data in await self.fetch_players():
-            owner_id, name, map_id, created, explored, exp, compendium, gold, *_ = data
-            # log.debug("DATA %s", data)
-            user = self.bot.get_user(owner_id)
-            if not user:
-                log.warning("Unknown user id %s. Skipping initialization. (%s)", owner_id, len(self.bot.users))
-                continue
-            status = await self.bot.redis.get(f"status_{user.id}")
-            if status:
-                status = utils.Status(int(status))
-            else:
-                status = utils.Status.idle
-            player = utils.Player(
-                owner=user,
-                bot=self.bot,
-                name=name,
-                created_at=created,
-                explored=list(map(self.bot.map_manager.get_map, explored)),
-                status=status,
-                exp=exp,
-                next_map=await self.bot.redis.get(f"next_map_{user.id}"),
-                compendium=compendium,
-                gold=gold
-            )
-            player.map = map_id
-            self.players.append(player)
-            log.info("Player \"%s\" (%s) initialized at map \"%s\".", player.name, str(player.owner), player.map)
+        await self.migrate_compendiums()
+        start = time.perf_counter()
+        rows = await self.fetch_players()
+        log.info("Fetched %s player rows in %.3fs.", len(rows), time.perf_counter() - start)
+        players = await self.load_players(rows)
+        self.players.load(players)
+        for player in players:
+            log.debug("Player \"%s\" (%s) initialized at map \"%s\".", player.name, player.owner_display, player.map)
+        for guild in self.bot.guilds:
+            self.index_guild(guild)
+        log.info("Loaded %s players in %.3fs.", len(self.players), time.perf_counter() - start)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member):
+        if member.id in self.players:
+            self.guild_index.add(member.guild.id, member.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        self.guild_index.discard(member.guild.id, member.id)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        self.index_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.guild_index.remove_guild(guild.id)
 
     @commands.Cog.listener()
     async def on_logout(self):
         log.debug("LOGOUT WAS CALLED")
-        async with self.bot.db.acquire() as cur:
-            for player in self.players:
-                await player.save(cursor=cur)
-                log.info("Flushed player \"%s\" (%s).", player.name, player.owner)
-        self.unload_event.set()
+        try:
+            count = await self.flush_dirty()
+            log.info("Flushed %s players.", count)
+        finally:
+            self.unload_event.set()
 
 
 def setup(bot):
@@ -20,6 +20,10 @@ CREATE TABLE IF NOT EXISTS players (
     gold INT NOT NULL DEFAULT 0
 );
 
+-- bit n is set when the enemy with id n+1 is recorded, see utils.Compendium
+-- compendium_data is only read for rows that haven't been migrated yet
+ALTER TABLE players ADD COLUMN IF NOT EXISTS compendium_bits BYTEA;
+
 CREATE TABLE IF NOT EXISTS blacklist (
     user_id BIGINT PRIMARY KEY UNIQUE NOT NULL,
     reason VARCHAR(255) NOT NULL
@@ -32,6 +36,9 @@ CREATE TABLE IF NOT EXISTS encounters (
     id SERIAL PRIMARY KEY
 );
 
+-- optional, one weight per entry in map_ids. NULL means every map has a weight of 1
+ALTER TABLE encounters ADD COLUMN IF NOT EXISTS spawn_weights REAL[] DEFAULT NULL;
+
 CREATE TABLE IF NOT EXISTS shop (
     "item" item NOT NULL,
     level_requirement INT NOT NULL DEFAULT 0
@@ -0,0 +1,161 @@
+"""
+Round robin PvP tournament between every persona.
+
+Every pair of personas fights --battles times, each demon picking one of
+its moves at random every turn. All battles of the tournament run at once
+as numpy arrays, using the formulas from utils.battle so the results
+match what the bot does. Prints the best and worst personas and can write
+the full win rate matrix (row's win rate against column) as CSV.
+
+The personas are read from the database in config.py, unless --personas
+is given a JSON list of persona_lookup rows, eg from
+    \\copy (SELECT json_agg(p) FROM persona_lookup p) TO 'personas.json'
+
+Needs numpy. Run from the repository root:
+    python -m tools.battle_tournament [--battles 100] [--csv matrix.csv]
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import sys
+import time
+
+import numpy
+
+import utils
+
+# whether each of utils.TYPES uses magic instead of strength, indexed by Roster.move_type
+IS_MAG = numpy.array([utils.is_mag(t) for t in utils.TYPES])
+
+
+async def fetch_catalog():
+    import asyncpg
+    import config
+
+    db = await asyncpg.connect(**config.ASYNCPG)
+    try:
+        return await utils.PersonaCatalog.fetch(db)
+    finally:
+        await db.close()
+
+
+class Roster:
+    """The personas as arrays, one row per persona."""
+
+    def __init__(self, personas):
+        self.names = [p.name for p in personas]
+        self.hp = numpy.array([p.hp for p in personas], dtype=numpy.int64)
+        (self.strength, self.magic, self.endurance, self.agility,
+         self.luck) = numpy.array([p.stats for p in personas], dtype=numpy.int64).T
+        self.resistances = numpy.array([p.resistances for p in personas], dtype=numpy.int64)
+        severities = dict(zip(utils.SEVERITIES, utils.SEVERITY_MODIFIERS))
+        width = max(len(p.moves) for p in personas)
+        self.move_count = numpy.array([len(p.moves) for p in personas])
+        self.move_type = numpy.zeros((len(personas), width), dtype=numpy.int64)
+        self.move_severity = numpy.zeros((len(personas), width))
+        for i, persona in enumerate(personas):
+            for j, move in enumerate(persona.moves.values()):
+                self.move_type[i, j] = utils.TYPES.index(move.type)
+                self.move_severity[i, j] = severities[move.severity]
+
+
+def attack(rng, roster, attacker, defender, attacker_hp, defender_hp):
+    """The vectorised utils.attack, for a random move of each attacker. Returns the new (attacker_hp, defender_hp)."""
+    size = len(attacker)
+    move = rng.integers(0, roster.move_count[attacker])
+    type_ = roster.move_type[attacker, move]
+    evaded = rng.integers(utils.EVADE_ROLL[0], utils.EVADE_ROLL[1] + 1, size) > utils.evade_chance(
+        roster.agility[defender] + roster.luck[defender], roster.agility[attacker] + roster.luck[attacker])
+    stat = numpy.where(IS_MAG[type_], roster.magic[attacker], roster.strength[attacker])
+    base = utils.base_damage(stat, roster.endurance[defender],
+                             rng.integers(utils.DAMAGE_ROLL[0], utils.DAMAGE_ROLL[1] + 1, size))
+    key = roster.resistances[defender, type_]
+    damage = utils.final_damage(base, roster.move_severity[attacker, move],
+                                numpy.take(utils.RESIST_MODIFIERS, key), numpy).astype(numpy.int64)
+    absorbed = ~evaded & (key == utils.Resist.absorb.value)
+    reflected = ~evaded & (key == utils.Resist.reflect.value)
+    hit = ~evaded & ~absorbed & ~reflected
+    defender_hp = numpy.where(absorbed, numpy.minimum(roster.hp[defender], defender_hp + damage),
+                              defender_hp - numpy.where(hit, damage, 0))
+    attacker_hp = attacker_hp - numpy.where(reflected, damage, 0)
+    return attacker_hp, defender_hp
+
+
+def tournament(roster, battles, max_turns=500, seed=None):
+    """Returns (wins, games), both persona x persona matrices."""
+    rng = numpy.random.default_rng(seed)
+    count = len(roster.names)
+    one, two = numpy.triu_indices(count, 1)
+    one, two = numpy.repeat(one, battles), numpy.repeat(two, battles)
+    # the faster demon is alpha, see utils.first_mover
+    swap = roster.agility[one] < roster.agility[two]
+    alpha, beta = numpy.where(swap, two, one), numpy.where(swap, one, two)
+    alpha_hp, beta_hp = roster.hp[alpha].copy(), roster.hp[beta].copy()
+    active = numpy.arange(len(alpha))
+    for _ in range(max_turns):
+        if not len(active):
+            break
+        a, b = alpha[active], beta[active]
+        # alpha is hit first, then beta, see utils.resolve_turn
+        b_hp, a_hp = attack(rng, roster, b, a, beta_hp[active], alpha_hp[active])
+        a_hp, b_hp = attack(rng, roster, a, b, a_hp, b_hp)
+        alpha_hp[active], beta_hp[active] = a_hp, b_hp
+        active = active[(a_hp > 0) & (b_hp > 0)]
+    # see utils.winner, alpha fainting is checked first
+    alpha_won = (alpha_hp > 0) & (beta_hp <= 0)
+    beta_won = alpha_hp <= 0
+    wins = numpy.zeros((count, count))
+    games = numpy.zeros((count, count))
+    numpy.add.at(wins, (alpha, beta), alpha_won)
+    numpy.add.at(wins, (beta, alpha), beta_won)
+    numpy.add.at(games, (alpha, beta), 1)
+    numpy.add.at(games, (beta, alpha), 1)
+    return wins, games
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-b", "--battles", type=int, default=100, help="battles per pair of personas")
+    parser.add_argument("--turns", type=int, default=500, help="turns before a battle counts as a draw")
+    parser.add_argument("--personas", help="JSON file of persona_lookup rows (default: the database)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--csv", help="write the win rate matrix to this CSV file")
+    args = parser.parse_args(argv)
+
+    if args.personas:
+        with open(args.personas) as f:
+            catalog = utils.PersonaCatalog.from_rows(json.load(f))
+    else:
+        catalog = asyncio.get_event_loop().run_until_complete(fetch_catalog())
+    personas = sorted((p for p in catalog if p.moves), key=lambda p: p.name)
+    if len(personas) < 2:
+        print("Need at least 2 personas with moves.", file=sys.stderr)
+        return 1
+
+    roster = Roster(personas)
+    start = time.perf_counter()
+    wins, games = tournament(roster, args.battles, args.turns, args.seed)
+    elapsed = time.perf_counter() - start
+    rates = numpy.divide(wins, games, out=numpy.zeros_like(wins), where=games > 0)
+
+    overall = wins.sum(axis=1) / games.sum(axis=1)
+    order = numpy.argsort(-overall)
+    shown = order if len(order) <= 20 else numpy.concatenate([order[:10], order[-10:]])
+    for i in shown:
+        print(f"{roster.names[i]:<24} {overall[i]:6.1%}")
+    total = int(games.sum()) // 2
+    print(f"Simulated {total:,} battles between {len(personas)} personas in {elapsed:.2f}s.")
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["persona", *roster.names])
+            for name, row in zip(roster.names, rates):
+                writer.writerow([name, *(f"{r:.4f}" for r in row)])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
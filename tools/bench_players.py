@@ -0,0 +1,100 @@
+"""
+Memory benchmark for loaded players.
+
+Builds synthetic players the way PlayerManager.load_players does and
+reports the bytes used per player. "before" is a replica of the old
+Player / Compendium layout (an instance dict each, a dirty set per player,
+the owners User held on the player); "after" is utils.Player.
+
+Run from the repository root:
+    python -m tools.bench_players [players]
+"""
+
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import utils
+from utils.objects import Compendium, Player
+
+
+class LegacyCompendium:
+    def __init__(self, player, bits=0):
+        self.player = player
+        self._bot = player._bot
+        self._bits = bits
+        self._count = bin(bits).count("1")
+
+
+class LegacyPlayer:
+    def __init__(self, **kwg):
+        self._bot = kwg.get("bot")
+        self._dirty = set()
+        self.owner = kwg.get("owner")
+        self._name = kwg.get("name")
+        self._map = self._bot.map_manager.resolve_map(kwg.get("map", 0))
+        self._next_map = None
+        self._exp = kwg.get("exp", 1)
+        self._next_level = min(99, int(self._exp ** .334)) + 1
+        self.created_at = kwg.get("created_at")
+        self._explored = set(map(int, kwg.get("explored", [0])))
+        self.status = kwg.get("status", utils.Status.idle)
+        self._deadline = kwg.get("deadline", None)
+        self._gold = kwg.get("gold", 0)
+        self.compendium = LegacyCompendium(self, Compendium.load(kwg.get("compendium", None)))
+
+
+def make_bot(count):
+    maps = {i: utils.Dummy(id=i, name=f"Map {i}") for i in range(16)}
+    users = {i: utils.Dummy(id=i, name=f"User {i}") for i in range(count)}
+    return utils.Dummy(
+        map_manager=utils.Dummy(resolve_map=maps.get, get_map=maps.get),
+        player_manager=utils.Dummy(players=utils.PlayerRegistry()),
+        get_user=users.get,
+        users=users,
+    )
+
+
+def make_rows(count):
+    rng = random.Random(0)
+    created = datetime(2019, 1, 1)
+    return [dict(owner_id=i, name=f"Player {i}", map=rng.randrange(16), created_at=created,
+                 explored=rng.sample(range(16), rng.randrange(1, 6)), exp=rng.randrange(1, 1000000),
+                 compendium=Compendium.dump(rng.getrandbits(237)), gold=rng.randrange(100000))
+            for i in range(count)]
+
+
+def measure(name, factory, bot, rows):
+    tracemalloc.start()
+    start = time.perf_counter()
+    before = tracemalloc.get_traced_memory()[0]
+    players = [factory(bot, row) for row in rows]
+    used = tracemalloc.get_traced_memory()[0] - before
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    print(f"{name:<8} {used / len(players):8.1f} bytes/player  {used / 2 ** 20:8.1f} MiB total  "
+          f"({elapsed:.2f}s to build)")
+    return players
+
+
+def legacy(bot, row):
+    row = dict(row, owner=bot.users[row["owner_id"]])
+    del row["owner_id"]
+    return LegacyPlayer(bot=bot, **row)
+
+
+def current(bot, row):
+    return Player(bot=bot, **row)
+
+
+def main(count=100000):
+    bot = make_bot(count)
+    rows = make_rows(count)
+    measure("before", legacy, bot, rows)
+    measure("after", current, bot, rows)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark for profile rendering.
+
+Compares the old profile_for drawing code (a font load per line, and an
+unconverted background) against utils.ProfileRenderer.
+
+Run from the repository root:
+    python -m tools.bench_profile [renders]
+"""
+
+import io
+import sys
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+from utils.profile import ProfileRenderer
+
+LINES = ("Player\nUser#0001\nCreated 3 days ago", "Tier 12\n1728 EXP", "Idling at\nAbel", "1,234 G")
+
+
+def make_avatar():
+    buffer = io.BytesIO()
+    Image.new("RGB", (512, 512), (120, 60, 200)).save(buffer, "png")
+    return buffer.getvalue()
+
+
+def old_render(background, avatar):
+    image = Image.open(io.BytesIO(avatar)).convert("RGBA")
+    image = image.resize((256, 256))
+    bg = background.copy()
+    bg.paste(image, (0, 0), image)
+    draw = ImageDraw.Draw(bg)
+    for position, text in zip(((5, 255), (265, 0), (265, 125), (265, 205)), LINES):
+        draw.text(position, text, (255, 255, 255), ImageFont.truetype("assets/Inkfree.ttf", 35))
+    n = io.BytesIO()
+    bg.save(n, "png")
+    return n
+
+
+def new_render(renderer, avatar):
+    return renderer.render(renderer.prepare_avatar(io.BytesIO(avatar)), LINES)
+
+
+def bench(name, func, count):
+    func()  # warm up
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<8} {count / elapsed:8.1f} renders/s ({elapsed * 1000 / count:.2f} ms each)")
+
+
+def main(count=200):
+    avatar = make_avatar()
+    with open("assets/profile_background.png", "rb") as f:
+        background = Image.open(io.BytesIO(f.read()))
+        background.convert("RGBA")  # the old code threw this result away
+    renderer = ProfileRenderer()
+    bench("before", lambda: old_render(background, avatar), count)
+    bench("after", lambda: new_render(renderer, avatar), count)
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,107 @@
+"""
+Benchmark for map routing.
+
+Builds random connected graphs shaped like the world map (a few nearby maps
+each, weights from map densities) and times the old djisktra against
+utils.djisktra / utils.Router, including explored-only queries, then fills
+a full route cache on the same graph and measures its memory.
+
+Run from the repository root:
+    python -m tools.bench_routing [nodes]
+"""
+
+import random
+import sys
+import time
+
+from utils.djisktra import Graph, Router, djisktra
+
+
+def old_djisktra(graph, initial, end):
+    shortest_paths = {initial: (None, 0)}
+    current_node = initial
+    visited = set()
+    while current_node != end:
+        visited.add(current_node)
+        destinations = graph.edges[current_node]
+        weight_to_current_node = shortest_paths[current_node][1]
+        for next_node in destinations:
+            weight = graph.weights[(current_node, next_node)] + weight_to_current_node
+            if next_node not in shortest_paths:
+                shortest_paths[next_node] = (current_node, weight)
+            else:
+                current_shortest_weight = shortest_paths[next_node][1]
+                if current_shortest_weight > weight:
+                    shortest_paths[next_node] = (current_node, weight)
+        next_destinations = {node: shortest_paths[node] for node in shortest_paths if node not in visited}
+        if not next_destinations:
+            raise IndexError("Path not possible")
+        current_node = min(next_destinations, key=lambda k: next_destinations[k][1])
+    path = []
+    while current_node is not None:
+        path.append(current_node)
+        current_node = shortest_paths[current_node][0]
+    return path[::-1]
+
+
+def make_graph(nodes, nearby=3, seed=0):
+    rng = random.Random(seed)
+    density = [rng.randrange(100, 2000) for _ in range(nodes)]
+    graph = Graph()
+    for node in range(1, nodes):
+        # link to an earlier node so the graph stays connected, then add some extra links
+        for other in {rng.randrange(node)} | {rng.randrange(nodes) for _ in range(nearby - 1)}:
+            if other != node and (node, other) not in graph.weights:
+                graph.add_map(node, other, density[node] + density[other])
+    return graph
+
+
+def timed(name, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    print(f"{name:<40} {(time.perf_counter() - start) * 1000:10.2f} ms")
+    return result
+
+
+def main(nodes=10000, queries=20):
+    rng = random.Random(1)
+    graph = make_graph(nodes)
+    pairs = [(rng.randrange(nodes), rng.randrange(nodes)) for _ in range(queries)]
+    print(f"{nodes} nodes, {len(graph.weights) // 2} edges, {queries} queries")
+
+    def run(func):
+        return [func(graph, a, b) for a, b in pairs]
+
+    if nodes <= 3000:  # the old version is quadratic, it takes minutes beyond this
+        expected = timed("old djisktra", run, old_djisktra)
+    else:
+        expected = None
+    paths = timed("heap djisktra", run, djisktra)
+    if expected is not None:
+        weight = lambda p: sum(graph.weights[e] for e in zip(p, p[1:]))  # noqa: E731
+        assert list(map(weight, expected)) == list(map(weight, paths))
+
+    router = Router(graph)
+    timed("router, first query per start", lambda: [router.path(a, b) for a, b in pairs])
+    timed("router, repeated queries", lambda: [router.path(a, b) for a, b in pairs])
+    allowed = set(rng.sample(range(nodes), nodes * 3 // 4))
+    found = 0
+    start = time.perf_counter()
+    for a, b in pairs:
+        try:
+            router.path(a, b, allowed | {b})
+            found += 1
+        except IndexError:
+            pass
+    print(f"{'router, 75% explored (' + str(found) + ' found)':<40} "
+          f"{(time.perf_counter() - start) * 1000:10.2f} ms")
+
+    full = Router(graph)
+    starts = rng.sample(range(nodes), min(nodes, full.max_tables))
+    timed(f"fill route cache, {len(starts)} starts", lambda: [full.path(a, 0) for a in starts])
+    size = sum(sys.getsizeof(part) for table in full._tables.values() for part in table)
+    print(f"{'route cache memory':<40} {size / 1024 / 1024:10.2f} MiB")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
@@ -0,0 +1,40 @@
+"""
+Compiles the map JSON files into a world snapshot for MapManager.
+
+The snapshot holds the maps, their links, travel weights and the
+shortest routes between every pair of maps. MapManager loads it
+instead of the JSON files while it is newer than all of them.
+
+Run from the repository root:
+    python -m tools.build_world [output] [maps directory]
+"""
+
+import os
+import sys
+import time
+
+from utils.world import WorldSnapshot, compile_world
+
+
+def main(output="world.bin", directory="maps"):
+    start = time.perf_counter()
+    try:
+        data = compile_world(directory)
+    except ValueError as e:
+        print(f"Couldn't compile the world: {e}", file=sys.stderr)
+        return 1
+    temp = output + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, output)
+    snapshot = WorldSnapshot(output)  # make sure it reads back
+    try:
+        print(f"Wrote {snapshot.count} maps to {output} ({len(data)} bytes) "
+              f"in {(time.perf_counter() - start) * 1000:.2f}ms.")
+    finally:
+        snapshot.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:3]))
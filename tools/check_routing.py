@@ -0,0 +1,93 @@
+"""
+Check for utils.Router.update, which MapManager uses when map files are reloaded.
+
+Fills a router's cache from every node of a random world shaped graph, then
+applies single edge changes the way a reload does (heavier, lighter, removed
+and added edges, and a removed map). Checks that tables which didn't route
+through the change are kept as they were, and that every kept table still
+gives shortest routes. Exits with 1 if any check fails.
+
+Run from the repository root:
+    python -m tools.check_routing [nodes] [seed]
+"""
+
+import random
+import sys
+
+from utils.djisktra import Router, shortest_paths
+from tools.bench_routing import make_graph
+
+
+def apply(graph, change):
+    """Applies `change` to `graph` and returns it as the {edge: (old, new)} Router.update takes."""
+    kind, node, other, weight = change
+    before = graph.edges_of([node])
+    if kind == "remove map":
+        graph.remove_node(node)
+    elif kind == "remove":
+        graph.edges[node].remove(other)
+        graph.edges[other].remove(node)
+        del graph.weights[(node, other)], graph.weights[(other, node)]
+    elif kind == "add":
+        graph.add_map(node, other, weight)
+    else:
+        graph.weights[(node, other)] = graph.weights[(other, node)] = weight
+    after = graph.edges_of([node])
+    return {edge: (before.get(edge), after.get(edge)) for edge in before.keys() | after.keys()
+            if before.get(edge) != after.get(edge)}
+
+
+def check(nodes, change, seed):
+    graph = make_graph(nodes, seed=seed)
+    router = Router(graph, max_tables=nodes)
+    for node in range(nodes):
+        router.path(node, node)
+    tables = dict(router._tables)
+    dropped = router.update(apply(graph, change))
+    kept = [node for node, table in tables.items() if router._tables.get(node) is table]
+    if len(kept) + dropped != nodes:
+        return "tables were replaced instead of kept or dropped", dropped
+    if dropped == nodes:
+        return "every table was dropped", dropped
+    for node in kept:
+        if node not in graph.edges:
+            continue
+        expected = shortest_paths(graph, node)
+        for end in range(nodes):
+            try:
+                path = router.path(node, end)
+            except IndexError:
+                path = None
+            if (path is None) != (end not in expected):
+                return f"kept table for {node} disagrees on reaching {end}", dropped
+            if path is not None and sum(graph.weights[e] for e in zip(path, path[1:])) != expected[end][1]:
+                return f"kept table for {node} has a longer route to {end}", dropped
+    return None, dropped
+
+
+def main(nodes=300, seed=0):
+    rng = random.Random(seed)
+    graph = make_graph(nodes, seed=seed)
+    # a link between two well connected maps, a link to a dead end is on every route
+    node, other = next((node, other) for node in rng.sample(range(nodes), nodes) for other in graph.edges[node]
+                       if len(graph.edges[node]) >= 3 and len(graph.edges[other]) >= 3)
+    weight = graph.weights[(node, other)]
+    missing = next(n for n in rng.sample(range(nodes), nodes) if n != node and (node, n) not in graph.weights)
+    changes = (
+        ("heavier", node, other, weight * 3),
+        ("lighter", node, other, weight // 3),
+        ("remove", node, other, None),
+        ("add", node, missing, weight),
+        ("remove map", node, None, None),
+    )
+    failed = 0
+    for change in changes:
+        error, dropped = check(nodes, change, seed)
+        print(f"{'FAIL' if error else 'ok':<4}  {change[0]:<10}  {dropped} of {nodes} tables dropped"
+              + (f"  {error}" if error else ""))
+        failed += error is not None
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*map(int, sys.argv[1:3])))
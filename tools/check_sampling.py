@@ -0,0 +1,70 @@
+"""
+Statistical check for utils.AliasTable.
+
+For a few weightings, including very uneven ones, checks that
+probabilities() matches the normalised weights, then draws samples with a
+seeded RNG and runs a chi-square goodness of fit test of the counts
+against the weights. Exits with 1 if any check fails.
+
+Run from the repository root:
+    python -m tools.check_sampling [samples] [seed]
+"""
+
+import math
+import random
+import sys
+
+from utils.sampling import AliasTable
+
+CASES = (
+    [1, 1, 1, 1],
+    [1, 2, 3, 4],
+    [0.1, 5, 0.1],
+    [0, 1, 3],
+    [1000, 1, 1, 1, 1, 1, 1, 1, 1, 1],
+    [0.5] * 50,
+)
+# z score for a 0.01% false alarm rate, so other seeds don't fail by chance
+Z = 3.72
+
+
+def chi_square_limit(df):
+    """The chi-square critical value for `df` degrees of freedom, with the Wilson-Hilferty approximation."""
+    return df * (1 - 2 / (9 * df) + Z * math.sqrt(2 / (9 * df))) ** 3
+
+
+def check(weights, samples, rng):
+    table = AliasTable(range(len(weights)), weights)
+    total = sum(weights)
+    expected = [w / total for w in weights]
+    chances = table.probabilities()
+    worst = max(abs(chances[i] - p) for i, p in enumerate(expected))
+    if worst > 1e-9:
+        return f"probabilities() is off by {worst:.2e}"
+
+    counts = [0] * len(weights)
+    for _ in range(samples):
+        counts[table.sample(rng)] += 1
+    if any(count and not p for count, p in zip(counts, expected)):
+        return "sampled an item with no weight"
+    statistic = sum((count - p * samples) ** 2 / (p * samples) for count, p in zip(counts, expected) if p)
+    df = sum(1 for p in expected if p) - 1
+    limit = chi_square_limit(df) if df else 0
+    if statistic > limit:
+        return f"chi-square {statistic:.2f} > {limit:.2f} ({df} df)"
+    return None
+
+
+def main(samples=200_000, seed=0):
+    rng = random.Random(seed)
+    failed = 0
+    for weights in CASES:
+        error = check(weights, samples, rng)
+        shown = weights if len(weights) <= 10 else f"{len(weights)} x {weights[0]}"
+        print(f"{'FAIL' if error else 'ok':<4}  {shown}" + (f"  {error}" if error else ""))
+        failed += error is not None
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(*map(int, sys.argv[1:3])))
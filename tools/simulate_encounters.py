@@ -0,0 +1,188 @@
+"""
+Monte Carlo balance simulator for the encounter command.
+
+Simulates encounters in every map that has enemies, for players drawn from
+a level distribution, using the same formulas as the bot (see the
+encounter formulas in utils.objects) vectorised with numpy.
+Reports, per map and per hour of encountering on cooldown:
+how often something is found, defeated, captured or knocks the player out,
+and the exp and gold gained or lost.
+
+The bot only offers to capture enemies missing from the player's compendium,
+and the player picks capture or defeat. --capture-share is the share of
+encounters where they try to capture, default 0 (always fight).
+A failed capture costs nothing, a failed fight knocks the player out.
+
+The enemies and player levels are read from the database in config.py,
+unless --encounters and --levels are given. --encounters takes a JSON list
+of encounters rows, eg from
+    \\copy (SELECT json_agg(e) FROM encounters e) TO 'encounters.json'
+
+Needs numpy. Run from the repository root:
+    python -m tools.simulate_encounters [-n SAMPLES] [--levels 1-99] [--capture-share 0.2]
+                                        [--csv out.csv] [--json out.json]
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy
+
+import utils
+
+# encountering as often as the cooldown allows
+ENCOUNTERS_PER_HOUR = utils.ENCOUNTER_COOLDOWN[0] * 3600 / utils.ENCOUNTER_COOLDOWN[1]
+
+COLUMNS = ("map_id", "map", "enemies", "mean_level", "found_rate", "defeat_rate", "capture_rate",
+           "failed_capture_rate", "knockout_rate",
+           "exp_per_hour", "gold_won_per_hour", "gold_lost_per_hour", "net_gold_per_hour")
+
+
+def load_maps(directory="maps"):
+    maps = {}
+    for file in utils.map_sources(directory):
+        with open(os.path.join(directory, file)) as f:
+            data = json.load(f)
+        maps[data["id"]] = data
+    return maps
+
+
+async def fetch_data():
+    import asyncpg
+    import config
+
+    db = await asyncpg.connect(**config.ASYNCPG)
+    try:
+        encounters = [dict(r) for r in await db.fetch("SELECT * FROM encounters;")]
+        exps = [r["exp"] for r in await db.fetch("SELECT exp FROM players;")]
+    finally:
+        await db.close()
+    return encounters, exps
+
+
+def parse_levels(text):
+    """'1-99' for every level equally, or '5,10,10,20' for those levels (repeat them to weigh them)."""
+    if "-" in text:
+        low, high = map(int, text.split("-"))
+        return numpy.arange(low, high + 1)
+    return numpy.array([int(i) for i in text.split(",")])
+
+
+def spawn_tables(encounters):
+    """Returns {map_id: (tiers, chances)}, the same spawn chances utils.AliasTable gives the bot."""
+    by_map = {}
+    for row in encounters:
+        weights = row.get("spawn_weights")
+        if weights is None or not utils.valid_spawn_weights(row["map_ids"], weights):
+            weights = [1.0] * len(row["map_ids"])
+        for map_id, weight in dict(zip(row["map_ids"], weights)).items():
+            by_map.setdefault(map_id, []).append((row["tier_requirement"], weight))
+    tables = {}
+    for map_id, entries in by_map.items():
+        table = utils.AliasTable(range(len(entries)), [weight for _, weight in entries])
+        chances = table.probabilities()
+        tables[map_id] = (numpy.array([tier for tier, _ in entries]),
+                          numpy.array([chances[i] for i in range(len(entries))]))
+    return tables
+
+
+def simulate_map(rng, tiers, chances, levels, samples, capture_share=0.0):
+    level = rng.choice(levels, samples)
+    found = rng.integers(utils.ENCOUNTER_ROLL[0], utils.ENCOUNTER_ROLL[1] + 1, samples) < \
+        utils.encounter_threshold(len(tiers), tiers.max(), level)
+    tier = tiers[rng.choice(len(tiers), samples, p=chances)]
+    # capturing and defeating use the same roll
+    won = rng.integers(utils.DEFEAT_ROLL[0], utils.DEFEAT_ROLL[1] + 1, samples) < \
+        utils.defeat_threshold(level, tier, numpy)
+    capture = found & (rng.random(samples) < capture_share)
+    fight = found & ~capture
+    beaten = fight & won
+    knocked_out = fight & ~won
+    low, high = utils.gold_range(tier)
+    gold = rng.integers(low, high + 1)
+    exp = numpy.where(beaten, utils.defeat_exp(tier, numpy), 0)
+    return dict(
+        mean_level=level.mean(),
+        found_rate=found.mean(),
+        defeat_rate=beaten.mean(),
+        capture_rate=(capture & won).mean(),
+        failed_capture_rate=(capture & ~won).mean(),
+        knockout_rate=knocked_out.mean(),
+        exp_per_hour=exp.mean() * ENCOUNTERS_PER_HOUR,
+        gold_won_per_hour=numpy.where(beaten, gold, 0).mean() * ENCOUNTERS_PER_HOUR,
+        gold_lost_per_hour=numpy.where(knocked_out, gold, 0).mean() * ENCOUNTERS_PER_HOUR,
+    )
+
+
+def simulate(maps, tables, levels, samples, seed=None, capture_share=0.0):
+    rng = numpy.random.default_rng(seed)
+    results = []
+    for map_id, (tiers, chances) in sorted(tables.items()):
+        data = maps.get(map_id)
+        if data is None or data.get("safe"):
+            continue  # encounter refuses to run in these
+        result = simulate_map(rng, tiers, chances, levels, samples, capture_share)
+        result.update(map_id=map_id, map=data["name"], enemies=len(tiers),
+                      net_gold_per_hour=result["gold_won_per_hour"] - result["gold_lost_per_hour"])
+        results.append(result)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--samples", type=int, default=1_000_000, help="encounters to simulate per map")
+    parser.add_argument("--levels", help="player levels, eg 1-99 or 5,10,20 (default: every player's level)")
+    parser.add_argument("--encounters", help="JSON file of encounters rows (default: the database)")
+    parser.add_argument("--capture-share", type=float, default=0.0,
+                        help="share of encounters where the player tries to capture instead of fighting (default: 0)")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--csv", help="write the results to this CSV file")
+    parser.add_argument("--json", help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+    if not 0 <= args.capture_share <= 1:
+        parser.error("--capture-share should be between 0 and 1")
+
+    encounters = exps = None
+    if args.encounters:
+        with open(args.encounters) as f:
+            encounters = json.load(f)
+    if encounters is None or args.levels is None:
+        fetched, exps = asyncio.get_event_loop().run_until_complete(fetch_data())
+        encounters = encounters or fetched
+    if args.levels:
+        levels = parse_levels(args.levels)
+    else:
+        levels = numpy.array([utils.Player.level_for(e) for e in exps] or [1])
+
+    maps = load_maps()
+    tables = spawn_tables(encounters)
+    start = time.perf_counter()
+    results = simulate(maps, tables, levels, args.samples, args.seed, args.capture_share)
+    elapsed = time.perf_counter() - start
+
+    for r in results:
+        print(f"{r['map']:<28} found {r['found_rate']:6.1%}  defeated {r['defeat_rate']:6.1%}  "
+              f"captured {r['capture_rate']:6.1%}  KO {r['knockout_rate']:6.1%}  "
+              f"{r['exp_per_hour']:9.1f} exp/h  {r['net_gold_per_hour']:+9.1f} G/h")
+    total = args.samples * len(results)
+    print(f"Simulated {total:,} encounters in {elapsed:.2f}s ({total / max(elapsed, 1e-9):,.0f}/s).")
+
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, COLUMNS)
+            writer.writeheader()
+            writer.writerows({k: r[k] for k in COLUMNS} for r in results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump([{k: (v.item() if isinstance(v, numpy.generic) else v) for k, v in r.items()}
+                       for r in results], f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,7 +4,15 @@ from .context import *
 from .errors import *
 from .paginator import *
 from .djisktra import *
+from .registry import *
+from .fuzzy import *
+from .sampling import *
+from .personas import *
+from .battle import *
 from .ipc import IPC
+from .profile import ProfileRenderer, ProfileSpec, RenderCache, RenderPool, RenderQueueFull
+from .images import ImageCache
+from .world import WorldSnapshot, compile_world, map_sources
 
 
 import asyncio
@@ -0,0 +1,81 @@
+import collections
+import math
+import random
+
+from .objects import Resist, TypeDict, _res_tuple, _severity, is_mag, resistance
+
+# The PvP rules, with no Discord in them.
+# The formulas only use operators, or functions from `xp`, so tools/battle_tournament.py
+# can run them on numpy arrays of whole tournaments at once.
+
+EVADE_ROLL = (1, 100)  # inclusive, the attack is evaded when the roll is over evade_chance
+DAMAGE_ROLL = (-3, 4)  # inclusive, added to the base damage
+
+TYPES = tuple(TypeDict._k)
+SEVERITIES = tuple(_severity)
+SEVERITY_MODIFIERS = tuple(_severity[s] for s in SEVERITIES)
+# damage modifier per resistance key, see BattleDemon
+RESIST_MODIFIERS = tuple(resistance[Resist(key).name] for key in range(6))
+
+# the damage the defending demon took from the attack, the damage is reflected back instead for Resist.reflect
+Turn = collections.namedtuple("Turn", "alpha_hit beta_hit")
+
+
+def evade_chance(defender_points, attacker_points):
+    """`*_points` are each demons agility + luck."""
+    return 100 - abs(defender_points - attacker_points)
+
+
+def base_damage(attack, endurance, roll):
+    """`attack` is the attackers strength for physical and gun moves, or their magic for the rest."""
+    return (attack * 2) - endurance + roll
+
+
+def final_damage(base, severity, modifier, xp=math):
+    """Applies the move severity and resistance modifier. Every hit does at least 1 damage."""
+    if xp is math:
+        damage = round(base * severity * modifier)
+        return damage if damage > 0 else 1
+    return xp.maximum(xp.rint(base * severity * modifier), 1)
+
+
+def attack(attacker, defender, type_, severity, rng=random):
+    """Resolves one attack of `type_` and `severity` from `attacker` on `defender`, updating their HP.
+    Returns (damage, Resist)."""
+    defender_points = defender.agility + defender.luck
+    if rng.randint(*EVADE_ROLL) > evade_chance(defender_points, attacker.agility + attacker.luck):
+        return _res_tuple(0, Resist.evade)
+    stat = attacker.magic if is_mag(type_) else attacker.strength
+    base = base_damage(stat, defender.endurance, rng.randint(*DAMAGE_ROLL))
+    res = defender.resists(type_)
+    damage = final_damage(base, _severity[severity], defender.resist_calc(res))
+    if res is Resist.absorb:
+        defender.heal(damage)
+    elif res is Resist.reflect:
+        attacker.reflect_damage(damage)
+    else:
+        defender.reflect_damage(damage)
+    return _res_tuple(damage, res)
+
+
+def resolve_turn(alpha, beta, alpha_move, beta_move, rng=random) -> Turn:
+    """Plays out a turn where `alpha` uses `alpha_move` and `beta` uses `beta_move`.
+    The moves are anything with a type and severity, eg utils.Move.
+    `alpha` is hit first, and both attacks happen even if alpha faints."""
+    alpha_hit = attack(beta, alpha, beta_move.type, beta_move.severity, rng)
+    beta_hit = attack(alpha, beta, alpha_move.type, alpha_move.severity, rng)
+    return Turn(alpha_hit, beta_hit)
+
+
+def first_mover(one, two):
+    """Returns the two demons as (alpha, beta), the faster demon being alpha."""
+    return (one, two) if one.agility >= two.agility else (two, one)
+
+
+def winner(alpha, beta):
+    """Returns the demon that won, or None if the battle isn't over."""
+    if alpha.is_fainted():
+        return beta
+    if beta.is_fainted():
+        return alpha
+    return None
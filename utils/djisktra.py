@@ -1,4 +1,6 @@
-from collections import defaultdict
+import heapq
+from array import array
+from collections import OrderedDict, defaultdict
 
 
 class Graph:
@@ -20,40 +22,208 @@ class Graph:
         self.weights[(from_node, to_node)] = weight
         self.weights[(to_node, from_node)] = weight
 
+    def edges_of(self, nodes):
+        """Returns {(node, other): weight} for every edge to or from the nodes in `nodes`, in both directions."""
+        found = {}
+        for node in nodes:
+            for other in self.edges.get(node, ()):
+                found[(node, other)] = found[(other, node)] = self.weights[(node, other)]
+        return found
 
-def djisktra(graph, initial, end):
-    # shortest paths is a dict of nodes
-    # whose value is a tuple of (previous node, weight)
-    shortest_paths = {initial: (None, 0)}
-    current_node = initial
+    def remove_node(self, node):
+        """Removes a node and every edge to or from it."""
+        for other in self.edges.pop(node, ()):
+            self.weights.pop((node, other), None)
+            self.weights.pop((other, node), None)
+            if other in self.edges:
+                self.edges[other] = [n for n in self.edges[other] if n != node]
+
+
+def shortest_paths(graph, initial, allowed=None, end=None):
+    """Runs Dijkstra from `initial` over the whole graph, or until `end` is reached.
+
+    Returns a dict of {node: (previous node, weight)} for the reached nodes.
+    If `allowed` is passed, only nodes in it are travelled through or to."""
+    shortest = {initial: (None, 0)}
     visited = set()
+    heap = [(0, initial)]
+    while heap:
+        weight, node = heapq.heappop(heap)
+        if node in visited:
+            continue
+        visited.add(node)
+        if node == end:
+            break
+        for next_node in graph.edges.get(node, ()):
+            if next_node in visited or (allowed is not None and next_node not in allowed):
+                continue
+            next_weight = weight + graph.weights[(node, next_node)]
+            if next_node not in shortest or next_weight < shortest[next_node][1]:
+                shortest[next_node] = (node, next_weight)
+                heapq.heappush(heap, (next_weight, next_node))
+    return shortest
+
+
+def _walk_back(shortest, end):
+    if end not in shortest:
+        raise IndexError("Path not possible")
+    path = []
+    while end is not None:
+        path.append(end)
+        end = shortest[end][0]
+    return path[::-1]
+
+
+def djisktra(graph, initial, end, allowed=None):
+    """Returns the list of nodes on the shortest path from `initial` to `end`, both included.
+    Raises IndexError if there is no path."""
+    return _walk_back(shortest_paths(graph, initial, allowed, end), end)
+
+
+class Router:
+    """Answers shortest path queries on a Graph.
+
+    Dijkstra is ran from a start node the first time it's asked for,
+    and the result is kept, so later queries from it are a walk back through a table.
+    Only the `max_tables` most recently used start nodes are kept.
+    If `loader` is passed, it's called with a start node for its table first
+    (eg WorldSnapshot.route_table), and Dijkstra only runs when it returns None.
 
-    while current_node != end:
-        visited.add(current_node)
-        destinations = graph.edges[current_node]
-        weight_to_current_node = shortest_paths[current_node][1]
+    Each table is a pair of arrays indexed by node slot, see _slot:
+    the slot of the previous node (the node's own at the start, -1 when unreached)
+    and the weight of the route (-1 when unreached)."""
 
-        for next_node in destinations:
-            weight = graph.weights[(current_node, next_node)] + weight_to_current_node
-            if next_node not in shortest_paths:
-                shortest_paths[next_node] = (current_node, weight)
+    __slots__ = ("graph", "max_tables", "loader", "_tables", "_slots", "_nodes")
+
+    def __init__(self, graph, *, max_tables=256, loader=None):
+        self.graph = graph
+        self.max_tables = max_tables
+        self.loader = loader
+        self._tables = OrderedDict()  # start node -> (previous, weights)
+        self._slots = {}  # node -> index in the tables
+        self._nodes = []
+
+    def __repr__(self):
+        return "<Router nodes={0} tables={1}>".format(len(self.graph.edges), len(self._tables))
+
+    def clear(self):
+        self._tables.clear()
+        self._slots.clear()
+        self._nodes.clear()
+        self.loader = None
+
+    def update(self, changes):
+        """Drops the cached tables that `changes` could make wrong, and keeps the rest.
+
+        `changes` is {(node, other): (old weight, new weight)} for the edges that changed,
+        in both directions, with None for an edge that was added or removed.
+        A table is dropped when it routes through an edge that was removed or got heavier,
+        or when an added or lighter edge gives a shorter route to a node.
+        Returns the amount of tables dropped."""
+        # a removed node only makes a table wrong if the table routes through it,
+        # which the edges from it catch, otherwise it's just marked unreached
+        removed = {self._slots[node] for edge in changes for node in edge
+                   if node not in self.graph.edges and node in self._slots}
+        stale = []
+        for initial, (previous, weights) in self._tables.items():
+            for (node, other), (old, new) in changes.items():
+                slot = self._slots.get(node, len(weights))
+                other_slot = self._slots.get(other, len(weights))
+                weight = weights[slot] if slot < len(weights) else -1
+                other_weight = weights[other_slot] if other_slot < len(weights) else -1
+                if old is not None and (new is None or new > old) and other_weight >= 0 \
+                        and other_slot != slot and previous[other_slot] == slot and other_slot not in removed:
+                    break
+                if new is not None and (old is None or new < old) and weight >= 0 \
+                        and (other_weight < 0 or weight + new < other_weight):
+                    break
             else:
-                current_shortest_weight = shortest_paths[next_node][1]
-                if current_shortest_weight > weight:
-                    shortest_paths[next_node] = (current_node, weight)
+                for slot in removed:
+                    if slot < len(weights):
+                        previous[slot] = weights[slot] = -1
+                continue
+            stale.append(initial)
+        for initial in stale:
+            del self._tables[initial]
+        return len(stale)
+
+    def _slot(self, node):
+        try:
+            return self._slots[node]
+        except KeyError:
+            slot = self._slots[node] = len(self._nodes)
+            self._nodes.append(node)
+            return slot
 
-        next_destinations = {node: shortest_paths[node] for node in shortest_paths if node not in visited}
-        if not next_destinations:
+    def _search(self, initial):
+        start = self._slot(initial)
+        for node in self.graph.edges:
+            self._slot(node)
+        slots = self._slots
+        previous = array("i", [-1]) * len(self._nodes)
+        weights = array("q", [-1]) * len(self._nodes)
+        previous[start] = start
+        weights[start] = 0
+        done = set()
+        heap = [(0, initial)]
+        while heap:
+            weight, node = heapq.heappop(heap)
+            if node in done:
+                continue
+            done.add(node)
+            slot = slots[node]
+            for next_node in self.graph.edges.get(node, ()):
+                if next_node in done:
+                    continue
+                next_slot = slots[next_node]
+                next_weight = weight + self.graph.weights[(node, next_node)]
+                if weights[next_slot] < 0 or next_weight < weights[next_slot]:
+                    previous[next_slot] = slot
+                    weights[next_slot] = next_weight
+                    heapq.heappush(heap, (next_weight, next_node))
+        return previous, weights
+
+    def _pack(self, table):
+        for node in table:
+            self._slot(node)
+        previous = array("i", [-1]) * len(self._nodes)
+        weights = array("q", [-1]) * len(self._nodes)
+        for node, (before, weight) in table.items():
+            slot = self._slots[node]
+            previous[slot] = slot if before is None else self._slots[before]
+            weights[slot] = weight
+        return previous, weights
+
+    def _table(self, initial):
+        try:
+            self._tables.move_to_end(initial)
+            return self._tables[initial]
+        except KeyError:
+            table = self.loader and self.loader(initial)
+            table = self._search(initial) if table is None else self._pack(table)
+            self._tables[initial] = table
+            if len(self._tables) > self.max_tables:
+                self._tables.popitem(last=False)
+            return table
+
+    def _walk_back(self, table, end):
+        previous, _ = table
+        slot = self._slots.get(end, len(previous))
+        if slot >= len(previous) or previous[slot] < 0:
             raise IndexError("Path not possible")
-        # next node is the destination with the lowest weight
-        current_node = min(next_destinations, key=lambda k: next_destinations[k][1])
+        path = [end]
+        while previous[slot] != slot:
+            slot = previous[slot]
+            path.append(self._nodes[slot])
+        return path[::-1]
 
-    # Work back through destinations in shortest path
-    path = []
-    while current_node is not None:
-        path.append(current_node)
-        next_node = shortest_paths[current_node][0]
-        current_node = next_node
-    # Reverse path
-    path = path[::-1]
-    return path
+    def path(self, initial, end, allowed=None):
+        """Returns the shortest path from `initial` to `end`, like djisktra.
+
+        If `allowed` is passed, the path only goes through nodes in it.
+        The cached path is used when it already fits,
+        otherwise a search limited to `allowed` is ran."""
+        path = self._walk_back(self._table(initial), end)
+        if allowed is None or all(node in allowed for node in path[1:]):
+            return path
+        return djisktra(self.graph, initial, end, allowed)
@@ -45,6 +45,11 @@ class NotSupporter(AdventureBase):
         super().__init__(f"{blobs.BLOB_ANGERY} You are not a supporter!")
 
 
+class ProfileBusy(AdventureBase):
+    def __init__(self):
+        super().__init__(f"{blobs.BLOB_SAD} Too many profiles are being drawn right now, try again in a bit!")
+
+
 class NoPlayer(AdventureBase):
     def __init__(self):
         super().__init__(f"{blobs.BLOB_PLSNO} You don't have a player! Use `*create` to make one!\n"
@@ -0,0 +1,61 @@
+import collections
+
+
+def trigrams(text: str) -> set:
+    """Returns the set of 3 character slices of `text`, case folded and padded with spaces."""
+    text = "  " + text.casefold() + " "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+    """A fuzzy string index, for "did you mean" style suggestions.
+
+    Strings are broken into trigrams up front, so a search only
+    looks at the strings sharing at least one trigram with the query
+    and scores them by the overlap (the Dice coefficient)."""
+
+    __slots__ = ("_grams", "_postings")
+
+    def __init__(self, strings=()):
+        self._grams = {}
+        self._postings = collections.defaultdict(set)
+        for string in strings:
+            self.add(string)
+
+    def __repr__(self):
+        return "<TrigramIndex total={0} trigrams={1}>".format(len(self._grams), len(self._postings))
+
+    def __len__(self):
+        return len(self._grams)
+
+    def add(self, string: str):
+        if string in self._grams:
+            return
+        grams = self._grams[string] = trigrams(string)
+        for gram in grams:
+            self._postings[gram].add(string)
+
+    def discard(self, string: str):
+        for gram in self._grams.pop(string, ()):
+            self._postings[gram].discard(string)
+            if not self._postings[gram]:
+                del self._postings[gram]
+
+    def clear(self):
+        self._grams.clear()
+        self._postings.clear()
+
+    def search(self, query: str, count=3, cutoff=0.4) -> list:
+        """Returns up to `count` indexed strings that look like `query`, best match first.
+        Strings scoring below `cutoff` (between 0 and 1) are left out."""
+        grams = trigrams(query)
+        shared = collections.Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        scored = []
+        for string, common in shared.items():
+            score = 2 * common / (len(grams) + len(self._grams[string]))
+            if score >= cutoff:
+                scored.append((-score, string))
+        scored.sort()
+        return [string for _, string in scored[:max(0, count)]]
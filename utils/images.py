@@ -0,0 +1,199 @@
+import asyncio
+import collections
+import hashlib
+import io
+import logging
+import os
+
+from PIL import Image
+
+from .profile import ProfileRenderer
+
+log = logging.getLogger("Adventure.PlayerManager")
+
+
+class ImageCache:
+    """A bounded cache of the images used to draw profiles.
+
+    Avatars are kept already resized, keyed by the users avatar hash,
+    and supporter backgrounds are kept already decoded, keyed by their url.
+    If `directory` is set, processed images are also written there
+    as PNGs so they survive restarts and memory evictions.
+    The files are kept under `max_disk_bytes`, dropping the least recently
+    used first, and a users old avatar is deleted once their new one is written.
+    Concurrent fetches of the same image share a single download."""
+
+    def __init__(self, session, *, max_bytes=64 * 1024 * 1024, directory=None,
+                 max_disk_bytes=256 * 1024 * 1024, loop=None):
+        self.session = session
+        self.loop = loop or asyncio.get_event_loop()
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.size = 0
+        self.disk_size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._disk = collections.OrderedDict()  # key -> file size, least recently used first
+        self._avatars = {}  # user id -> key of their avatar on disk
+        self._pending = {}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._scan_disk()
+
+    def __repr__(self):
+        return "<ImageCache entries={0} size={1.size} hits={1.hits} disk_hits={1.disk_hits} misses={1.misses}>" \
+            .format(len(self._entries), self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def avatar(self, user) -> Image.Image:
+        """Returns the users avatar as RGBA, resized for the profile."""
+        key = f"avatar-{user.id}-{user.avatar or user.discriminator}"
+        return await self.get(key, str(user.avatar_url_as(format="png", size=256)), ProfileRenderer.prepare_avatar)
+
+    async def background(self, url) -> Image.Image:
+        """Returns a supporters custom background, decoded as RGBA."""
+        key = "background-" + hashlib.sha1(url.encode()).hexdigest()
+        return await self.get(key, url, ProfileRenderer.prepare_background)
+
+    async def get(self, key, url, process) -> Image.Image:
+        """Returns the image cached under `key`.
+        On a miss, `url` is downloaded and passed through `process` in the executor."""
+        try:
+            self._entries.move_to_end(key)
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return self._entries[key]
+        task = self._pending.get(key)
+        if task is None:
+            task = self._pending[key] = asyncio.ensure_future(self._fetch(key, url, process))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key, url, process):
+        try:
+            image = await self._from_disk(key)
+            if image is None:
+                self.misses += 1
+                async with self.session.get(url) as get:
+                    data = await get.read()
+                image = await self.loop.run_in_executor(None, process, io.BytesIO(data))
+                await self._to_disk(key, image)
+            else:
+                self.disk_hits += 1
+        finally:
+            del self._pending[key]
+        self._store(key, image)
+        return image
+
+    def _store(self, key, image):
+        size = image.width * image.height * 4
+        if size > self.max_bytes:
+            return
+        self._entries[key] = image
+        self.size += size
+        while self.size > self.max_bytes:
+            _, old = self._entries.popitem(last=False)
+            self.size -= old.width * old.height * 4
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".png")
+
+    @staticmethod
+    def _avatar_owner(key):
+        return key.split("-")[1] if key.startswith("avatar-") else None
+
+    def _scan_disk(self):
+        # oldest first, files are touched when they're read so this is least recently used first
+        files = sorted(((e.stat(), e.name[:-4]) for e in os.scandir(self.directory)
+                        if e.is_file() and e.name.endswith(".png")), key=lambda f: f[0].st_mtime)
+        stale = []
+        for stat, key in files:
+            stale += self._track(key, stat.st_size)
+        self._remove_files(stale + self._trim_disk())
+
+    def _track(self, key, size) -> list:
+        """Adds a file to the disk index. Returns the keys that are now stale, and were dropped from it."""
+        self._forget(key)
+        self._disk[key] = size
+        self.disk_size += size
+        owner = self._avatar_owner(key)
+        if owner is None:
+            return []
+        old = self._avatars.get(owner)
+        self._avatars[owner] = key
+        return [old] if old is not None and self._forget(old) else []
+
+    def _forget(self, key) -> bool:
+        size = self._disk.pop(key, None)
+        if size is None:
+            return False
+        self.disk_size -= size
+        owner = self._avatar_owner(key)
+        if self._avatars.get(owner) == key:
+            del self._avatars[owner]
+        return True
+
+    def _trim_disk(self) -> list:
+        """Drops the least recently used files from the disk index until it fits. Returns their keys."""
+        dropped = []
+        while self.disk_size > self.max_disk_bytes and len(self._disk) > 1:
+            key = next(iter(self._disk))
+            self._forget(key)
+            dropped.append(key)
+        return dropped
+
+    def _remove_files(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError as e:
+                log.warning("Couldn't remove cached image %s. [%s: %s]", key, type(e).__name__, str(e))
+
+    async def _from_disk(self, key):
+        if not self.directory or key not in self._disk:
+            return None
+
+        def load():
+            path = self._path(key)
+            with Image.open(path) as image:
+                image = image.convert("RGBA")
+            os.utime(path)
+            return image
+
+        try:
+            image = await self.loop.run_in_executor(None, load)
+        except OSError as e:
+            log.warning("Couldn't read cached image %s. [%s: %s]", key, type(e).__name__, str(e))
+            self._forget(key)
+            return None
+        if key in self._disk:
+            self._disk.move_to_end(key)
+        return image
+
+    async def _to_disk(self, key, image):
+        if not self.directory:
+            return
+
+        def save():
+            path = self._path(key)
+            image.save(path, "png")
+            return os.path.getsize(path)
+
+        try:
+            size = await self.loop.run_in_executor(None, save)
+        except OSError as e:
+            log.warning("Couldn't write cached image %s. [%s: %s]", key, type(e).__name__, str(e))
+            return
+        stale = self._track(key, size) + self._trim_disk()
+        if stale:
+            await self.loop.run_in_executor(None, self._remove_files, stale)
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
@@ -4,11 +4,12 @@ import enum
 import random
 import logging
 import math
-import operator
+import time as _time
 from datetime import datetime, timedelta
 from typing import *
 
 # -> Pip packages
+import discord
 import humanize
 
 # -> Local files
@@ -75,28 +76,47 @@ class Map:
         return math.floor(self.calculate_explore() * 15)
 
 
+SAVE_QUERY = """
+INSERT INTO players (owner_id, name, map_id, created_at, explored, exp, compendium_bits, gold)
+VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+ON CONFLICT (owner_id)
+DO UPDATE
+SET name = $2, map_id = $3, explored = $5, exp = $6, compendium_bits = $7, gold = $8
+WHERE players.owner_id = $1;
+"""
+
+
+_CLEAN = frozenset()
+
+
 class Player:
+    __slots__ = ("_bot", "_dirty", "owner_id", "_name", "_map", "_next_map", "_exp", "_level", "_next_level",
+                 "created_at", "_explored", "status", "_deadline", "_gold", "compendium")
 
     def __init__(self, **kwg):
         self._bot = kwg.get("bot")
-        self.owner = kwg.get("owner")
-        self.name = kwg.get("name")
-        self._map = self._bot.map_manager.get_map(0)
+        # names of the fields changed since the last save
+        # clean players share the empty frozenset, mark_dirty replaces it
+        self._dirty = _CLEAN
+        owner = kwg.get("owner")
+        self.owner_id = kwg["owner_id"] if owner is None else owner.id
+        self._name = kwg.get("name")
+        self._map = self._bot.map_manager.resolve_map(kwg.get("map", 0))
         self._next_map = kwg.get("next_map", None)
         if self._next_map is not None:
             self._next_map = self._bot.map_manager.resolve_map(self._next_map)
-        self.exp = kwg.get("exp", 1)
-        self._next_level = self.level + 1
+        self._exp = kwg.get("exp", 1)
+        self._level = self.level_for(self._exp)
+        self._next_level = self._level + 1
         self.created_at = kwg.get("created_at")
-        self._explored_maps = kwg.get("explored", [self._bot.map_manager.get_map(0)])
+        # ids of the explored maps, explored_maps has the Map objects
+        self._explored = set(map(int, kwg.get("explored", [0])))
         self.status = kwg.get("status", Status.idle)
-        self.gold = kwg.get("gold", 0)
-        rd = kwg.get("compendium", None)
-        if not rd:
-            self.raw_compendium_data = [0] * 237
-        else:
-            self.raw_compendium_data = rd
-        self.compendium = Compendium(self)
+        # unix timestamp of when the current travel / exploration finishes
+        # the redis keys are only read when this has passed, or on startup
+        self._deadline = kwg.get("deadline", None)
+        self._gold = kwg.get("gold", 0)
+        self.compendium = Compendium(self, Compendium.load(kwg.get("compendium", None)))
 
     def __repr__(self):
         return "<Player name='{0.name}' owner={0.owner!r} exp={0.exp} coins={0.gold}>".format(self)
@@ -104,6 +124,67 @@ class Player:
     def __str__(self):
         return self.name
 
+    @property
+    def owner(self):
+        """The owners User, looked up from the bots cache.
+        This is None when they aren't cached, see fetch_owner and owner_display."""
+        return self._bot.get_user(self.owner_id)
+
+    @property
+    def owner_display(self) -> str:
+        """The owners name for showing in text, or their ID if they aren't cached."""
+        owner = self.owner
+        return str(self.owner_id) if owner is None else str(owner)
+
+    async def fetch_owner(self):
+        """The owners User, fetched from Discord if they aren't cached.
+        Returns None if the account doesn't exist anymore."""
+        owner = self.owner
+        if owner is None:
+            try:
+                owner = await self._bot.fetch_user(self.owner_id)
+            except discord.NotFound:
+                return None
+        return owner
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @name.setter
+    def name(self, value):
+        self._name = value
+        self.mark_dirty("name")
+
+    @property
+    def exp(self) -> int:
+        return self._exp
+
+    @exp.setter
+    def exp(self, value):
+        self._exp = value
+        self._level = self.level_for(value)
+        self.mark_dirty("exp")
+        self._bot.player_manager.players.update_rank(self)
+
+    @property
+    def gold(self) -> int:
+        return self._gold
+
+    @gold.setter
+    def gold(self, value):
+        self._gold = value
+        self.mark_dirty("gold")
+
+    @property
+    def is_dirty(self) -> bool:
+        return bool(self._dirty)
+
+    def mark_dirty(self, *fields):
+        """Marks fields as changed, so the next flush will save this player.
+        Passing no fields just marks the player as a whole."""
+        self._dirty = self._dirty.union(fields or ("all",))
+
     @property
     def healthpoints(self) -> float:
         return self.strength * 2
@@ -122,19 +203,29 @@ class Player:
 
     @property
     def level(self) -> int:
-        return min(99, math.floor(self.exp ** .334))
+        return self._level
+
+    @staticmethod
+    def level_for(exp) -> int:
+        return min(99, math.floor(exp ** .334))
 
     @property
     def explored_maps(self) -> List[Map]:
-        return self._explored_maps
+        maps = map(self._bot.map_manager.get_map, sorted(self._explored))
+        return [m for m in maps if m is not None]
 
     @explored_maps.setter
     def explored_maps(self, value):
-        self._explored_maps = list(map(self._bot.map_manager.get_map, value))
+        self._explored = set(map(int, value))
+        self.mark_dirty("explored")
+
+    def add_explored(self, map: Map):
+        self._explored.add(map.id)
+        self.mark_dirty("explored")
 
     @property
     def is_admin(self) -> bool:
-        return self.owner.id in self._bot.config.OWNERS
+        return self.owner_id in self._bot.config.OWNERS
 
     @property
     def map(self) -> Map:
@@ -143,6 +234,7 @@ class Player:
     @map.setter
     def map(self, value):
         self._map = self._bot.map_manager.resolve_map(value)
+        self.mark_dirty("map")
 
     # -- Checks -- #
 
@@ -152,6 +244,11 @@ class Player:
     async def is_exploring(self) -> bool:
         return await self.explore_time() > 0
 
+    def _time_left(self) -> int:
+        if self._deadline is None:
+            return 0
+        return max(0, math.ceil(self._deadline - _time.time()))
+
     # -- Updaters -- #
 
     async def update(self, ctx):
@@ -169,48 +266,58 @@ class Player:
         return False
 
     async def update_travelling(self) -> bool:
-        if await self.is_travelling():
-            if self.next_map is None:
-                dest = await self._bot.redis.get(f"next_map_{self.owner.id}")
-                self.next_map = dest.decode()
-            return False  # the TTL hasnt expired
+        if self.status is not Status.travelling or await self.is_travelling():
+            return False  # the deadline hasnt passed
         if self.next_map is None:
-            dest = await self._bot.redis.get(f"next_map_{self.owner.id}")
-        else:
-            dest = self.next_map.id
-        if dest is None:
-            return False  # the player isnt travelling at all
+            dest = await self._bot.redis.get(f"next_map_{self.owner_id}")
+            if dest is None:
+                return False  # the player isnt travelling at all
+            self.next_map = dest
         self.exp += self.map.travel_exp(self.next_map)
-        self._next_map = None
         plylog.info("%s has arrived at their location.", self.name)
-        self.map = dest
-        await self._bot.redis.delete(f"next_map_{self.owner.id}")
-        await self._bot.redis.set(f"status_{self.owner.id}", "0")
+        self.map = self.next_map
+        self._next_map = None
+        self._deadline = None
+        await self._bot.redis.delete(f"next_map_{self.owner_id}")
+        await self._bot.redis.set(f"status_{self.owner_id}", "0")
         self.status = Status.idle
         return True
 
     async def update_exploring(self) -> bool:
-        if await self.is_exploring():
+        if self.status is not Status.exploring or await self.is_exploring():
             return False
-        if self.status == Status.exploring or await self._bot.redis.get(f"status_{self.owner.id}") == 2:
-            plylog.info("%s has finished exploring %s.", self.name, self.map)
-            await self._bot.redis.set(f"status_{self.owner.id}", "0")
-            self.status = Status.idle
-            self.exp += self.map.explore_exp()
-            return True
+        plylog.info("%s has finished exploring %s.", self.name, self.map)
+        self._deadline = None
+        await self._bot.redis.set(f"status_{self.owner_id}", "0")
+        self.status = Status.idle
+        self.exp += self.map.explore_exp()
+        return True
 
     async def travel_time(self) -> int:
-        if not self.next_map:
-            self.next_map = await self._bot.redis.get(f"next_map_{self.owner.id}")
-        return await self._bot.redis.ttl(f"travelling_{self.owner.id}")
+        if self.status is not Status.travelling:
+            return 0
+        return self._time_left()
 
     async def explore_time(self) -> int:
-        return await self._bot.redis.ttl(f"exploring_{self.owner.id}")
+        if self.status is not Status.exploring:
+            return 0
+        return self._time_left()
+
+    async def finish_now(self):
+        """Makes the current travel / exploration finish immediately.
+        The player will arrive on their next message."""
+        if await self.is_travelling():
+            await self._bot.redis.set(f"travelling_{self.owner_id}", "0", expire=1)
+        elif await self.is_exploring():
+            await self._bot.redis.set(f"exploring_{self.owner_id}", "0", expire=1)
+        else:
+            return
+        self._deadline = _time.time()
 
     # -- Real functions -- #
 
     def has_explored(self, map: Map):
-        return map.is_safe or map in self.explored_maps
+        return map.is_safe or map.id in self._explored
 
     def exp_to_next_level(self):
         next_exp = self._next_level ** 3
@@ -230,9 +337,10 @@ class Player:
         self.next_map = destination
         plylog.info("%s is adventuring to %s and will finish in %.2f hours.",
                     self.name, destination, destination.calculate_travel_to(self))
-        await self._bot.redis.set(f"travelling_{self.owner.id}", str(time), expire=time)
-        await self._bot.redis.set(f"next_map_{self.owner.id}", str(destination.id))
-        await self._bot.redis.set(f"status_{self.owner.id}", "1")
+        self._deadline = _time.time() + time
+        await self._bot.redis.set(f"travelling_{self.owner_id}", str(time), expire=time)
+        await self._bot.redis.set(f"next_map_{self.owner_id}", str(destination.id))
+        await self._bot.redis.set(f"status_{self.owner_id}", "1")
         self.status = Status.travelling
 
     async def explore(self):
@@ -244,46 +352,43 @@ class Player:
             raise utils.AlreadyTravelling(self.name,
                                           humanize.naturaltime((datetime.now() + timedelta(
                                               seconds=await self.explore_time()))))
-        if self.map in self._explored_maps:
+        if self.map.id in self._explored:
             raise utils.AlreadyExplored(self.map)
         time = int(((datetime.utcnow() + timedelta(hours=self.map.calculate_explore())
                      ) - datetime.utcnow()).total_seconds())
         plylog.info("%s is exploring %s and will finish in %.2f hours.",
                     self.name, self.map, self.map.calculate_explore())
-        await self._bot.redis.set(f"exploring_{self.owner.id}", str(time), expire=time)
-        await self._bot.redis.set(f"status_{self.owner.id}", "2")
+        self._deadline = _time.time() + time
+        await self._bot.redis.set(f"exploring_{self.owner_id}", str(time), expire=time)
+        await self._bot.redis.set(f"status_{self.owner_id}", "2")
         self.status = Status.exploring
-        self._explored_maps.append(self.map)
+        self.add_explored(self.map)
+
+    def to_row(self) -> tuple:
+        """Returns the arguments for SAVE_QUERY."""
+        return (self.owner_id, self.name, self._map.id, self.created_at,
+                sorted(self._explored), self.exp,
+                self.compendium.to_bytes(), self.gold)
 
     async def save(self, *, cursor=None):
-        q = """
-INSERT INTO players (owner_id, name, map_id, created_at, explored, exp, compendium_data, gold)
-VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-ON CONFLICT (owner_id)
-DO UPDATE
-SET name = $2, map_id = $3, explored = $5, exp = $6, compendium_data = $7, gold = $8
-WHERE players.owner_id = $1;
-        """
-        if not cursor:
-            await self._bot.db.execute(q, self.owner.id, self.name, self._map.id, self.created_at,
-                                       list(map(operator.attrgetter("id"), self.explored_maps)), self.exp,
-                                       self.raw_compendium_data, self.gold)
-        else:
-            await cursor.execute(q, self.owner.id, self.name, self._map.id, self.created_at,
-                                 list(map(operator.attrgetter("id"), self.explored_maps)), self.exp,
-                                 self.raw_compendium_data, self.gold)
+        fields, self._dirty = self._dirty, _CLEAN
+        try:
+            await (cursor or self._bot.db).execute(SAVE_QUERY, *self.to_row())
+        except Exception:
+            self._dirty |= fields
+            raise
 
     async def delete(self, *, cursor=None):
         if not cursor:
-            await self._bot.db.execute("DELETE FROM players WHERE owner_id=$1;", self.owner.id)
+            await self._bot.db.execute("DELETE FROM players WHERE owner_id=$1;", self.owner_id)
         else:
-            await cursor.execute("DELETE FROM players WHERE owner_id=$1;", self.owner.id)
-        await self._bot.redis.delete(f"travelling_{self.owner.id}")
-        await self._bot.redis.delete(f"next_map_{self.owner.id}")
-        await self._bot.redis.delete(f"exploring_{self.owner.id}")
-        await self._bot.redis.delete(f"status_{self.owner.id}")
-        self._bot.player_manager.players.remove(self)
-        plylog.info("Player \"%s\" was deleted. (%s [%s])", self.name, self.owner, self.owner.id)
+            await cursor.execute("DELETE FROM players WHERE owner_id=$1;", self.owner_id)
+        await self._bot.redis.delete(f"travelling_{self.owner_id}")
+        await self._bot.redis.delete(f"next_map_{self.owner_id}")
+        await self._bot.redis.delete(f"exploring_{self.owner_id}")
+        await self._bot.redis.delete(f"status_{self.owner_id}")
+        self._bot.player_manager.remove_player(self)
+        plylog.info("Player \"%s\" was deleted. (%s [%s])", self.name, self.owner_display, self.owner_id)
 
 
 class Item:
@@ -297,46 +402,113 @@ class Item:
 
 
 class Enemy:
-    def __init__(self, *, id, name, maps, tier):
+    def __init__(self, *, id, name, maps, tier, weights=None):
         self.id: int = id
         self.name: str = name
         self.maps: List[Map] = maps
         self.tier: int = tier
+        # map id -> how likely this enemy is to spawn there, relative to the other enemies in it
+        self.weights: Dict[int, float] = weights or {m.id: 1.0 for m in maps if m is not None}
 
     def __repr__(self):
         return '<Enemy id={0.id} name="{0.name}" maps={0.maps} tier={0.tier}>'.format(self)
 
     def defeat(self, tier):
-        diff = (tier ** 2) / (self.tier ** 2)
-        normalized = math.tanh(diff / 4.6)
-        ret = random.randint(1, 100) < round(normalized * 100)
-        return ret
+        return random.randint(*DEFEAT_ROLL) < defeat_threshold(tier, self.tier)
+
+
+# -- Encounter formulas -- #
+# tools/simulate_encounters.py runs these on numpy arrays, passing numpy as `xp`,
+# so they should only use operators and functions that numpy has as well
+
+ENCOUNTER_COOLDOWN = (5, 120)  # the encounter command can be used this many times per this many seconds
+ENCOUNTER_ROLL = (0, 100)  # inclusive, something is found when the roll is under encounter_threshold
+DEFEAT_ROLL = (1, 100)  # inclusive, the enemy is defeated (or captured) when the roll is under defeat_threshold
+
+
+def encounter_threshold(enemies, strongest, level):
+    """`enemies` and `strongest` are the amount of enemies in the map and their highest tier."""
+    return 100 + ((enemies - strongest) - level)
+
+
+def defeat_threshold(level, tier, xp=math):
+    diff = (level ** 2) / (tier ** 2)
+    normalized = xp.tanh(diff / 4.6)
+    return round(normalized * 100) if xp is math else xp.rint(normalized * 100)
+
+
+def defeat_exp(tier, xp=math):
+    return xp.ceil(tier ** 2 / 2.5)
+
+
+def valid_spawn_weights(map_ids, weights):
+    """Whether an encounters row's spawn_weights can be used, one positive weight per map in map_ids."""
+    return len(weights) == len(map_ids) and all(w > 0 for w in weights)
+
+
+def gold_range(tier):
+    """The inclusive range of gold won for defeating an enemy of `tier`, or lost to it when knocked out."""
+    return tier * 2, tier * 6
+
+
+COMPENDIUM_SIZE = 237  # total enemies that can be recorded
 
 
 class Compendium:
-    def __init__(self, player):
+    """The enemies a player has recorded, as a bitset.
+    Bit n is set when the enemy with ID n+1 is recorded."""
+
+    __slots__ = ("player", "_bits", "_count")
+
+    def __init__(self, player, bits=0):
         self.player = player
-        # noinspection PyProtectedMember
-        self._bot = player._bot
+        self._bits = bits
+        self._count = bin(bits).count("1")
 
     def __repr__(self):
         return "<Compendium owner={0.player.owner!r} flags={0.count}>".format(self)
 
+    @staticmethod
+    def load(data) -> int:
+        """Converts stored compendium data to bits.
+        This accepts the BYTEA column, or the old SMALLINT[] column."""
+        if not data:
+            return 0
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            return int.from_bytes(data, "little")
+        return sum(1 << i for i, flag in enumerate(data) if flag)
+
+    @staticmethod
+    def dump(bits: int) -> bytes:
+        """Converts bits to the BYTEA column format."""
+        return bits.to_bytes(max(-(-COMPENDIUM_SIZE // 8), -(-bits.bit_length() // 8)), "little")
+
+    def to_bytes(self) -> bytes:
+        return self.dump(self._bits)
+
     @property
     def count(self):
-        return sum(self.bits)
+        return self._count
 
     @property
     def bits(self):
-        return self.player.raw_compendium_data
+        return self._bits
 
     def record_enemy(self, enemy):
         if self.is_enemy_recorded(enemy):
             raise ValueError("Enemy is already in book.")
-        self.player.raw_compendium_data[enemy.id-1] = 1
+        self._bits |= 1 << (enemy.id-1)
+        self._count += 1
+        self.player.mark_dirty("compendium")
+        self._bot.player_manager.players.update_rank(self.player)
+
+    @property
+    def _bot(self):
+        # noinspection PyProtectedMember
+        return self.player._bot
 
     def is_enemy_recorded(self, enemy):
-        return self.bits[enemy.id-1]
+        return bool(self._bits >> (enemy.id-1) & 1)
 
     def format(self):
         fin = [e.name for e in sorted(self._bot.enemy_manager.enemies, key=lambda e: e.id) if self.is_enemy_recorded(e)]
@@ -416,6 +588,17 @@ class BattleDemon:
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_persona(cls, persona, owner):
+        """Makes a demon for `owner` (a Player) from a catalog Persona."""
+        return cls(name=persona.name, owner=owner, hp=persona.hp, moves=persona.moves, stats=persona.stats,
+                   resistances=persona.resistances)
+
+    @property
+    def moves(self):
+        """Returns a {name: Move} mapping of the demons moves."""
+        return self._moves
+
     @property
     def strength(self):
         """Returns an int of the demons Strength stat."""
@@ -457,14 +640,12 @@ class BattleDemon:
         This is affected by the Luck and Agility of
 
         One day this will be affected by status ailments in v3."""
-        bp = self._agility + self._luck
-        ep = other.agility + other.luck
-        return 100 - (max(bp, ep) - min(bp, ep))
+        return utils.evade_chance(self._agility + self._luck, other.agility + other.luck)
 
-    def try_evade(self, other):
+    def try_evade(self, other, rng=random):
         """Returns a bool whether you successfully evaded the attack.
         This is random, based on BattleDemon.evade_chance."""
-        return random.randint(1, 100) > self.evade_chance(other)
+        return rng.randint(*utils.EVADE_ROLL) > self.evade_chance(other)
 
     def is_fainted(self):
         """Returns a bool whether the demon has run out of HP."""
@@ -484,34 +665,20 @@ class BattleDemon:
         return resistance[type_.name]
 
     def reflect_damage(self, amount):
-        """Hmm"""
+        """Subtracts HP from the demon, without any modifiers."""
         self._hp -= amount
 
-    def take_damage(self, demon, type_, severity):
+    def heal(self, amount):
+        """Adds HP to the demon, up to its max HP."""
+        self._hp = min(self._max_hp, self._hp + amount)
+
+    def take_damage(self, demon, type_, severity, rng=random):
         """Subtracts damage from the demons HP.
         This takes into account the demons endurance, type resistances and move severity.
-        Returns a namedtuple with the total damage dealt, and the effect (resist, absorb etc)."""
-        if self.try_evade(demon):
-            return _res_tuple(0, Resist.evade)
-        if not is_mag(type_):
-            base = (demon.strength*2) - self.endurance
-        else:
-            base = (demon.magic*2) - self.endurance
-        base += random.randint(-3, 4)
-        res = self.resists(type_)
-        sevmod = _severity[severity]
-        base *= sevmod
-        mod = self.resist_calc(res)
-        base = round(base * mod)
-        base = base if base > 0 else 1
-        # ^ This is to ensure all moves do at least 1 hitpoint of damage.
-        if res is Resist.absorb:
-            self._hp = min(self._max_hp, self._hp + base)
-        elif res is Resist.reflect:
-            demon.reflect_damage(base)
-        else:
-            self._hp -= base
-        return _res_tuple(base, res)
+        Returns a namedtuple with the total damage dealt, and the effect (resist, absorb etc).
+        The rules are in utils.battle.attack."""
+        return utils.attack(demon, self, type_, severity, rng)
 
 
 Quest = collections.namedtuple("Quest", "qid find exp gold")
+SupporterSettings = collections.namedtuple("SupporterSettings", "userid cstmbg textcol")
@@ -0,0 +1,59 @@
+import collections
+import json
+import types
+
+Move = collections.namedtuple("Move", "name type severity")
+# stats: (strength, magic, endurance, agility, luck)
+# resistances: one key per type, in TypeDict order, see BattleDemon
+# moves: a read only {name: Move} mapping, in the order they're stored
+Persona = collections.namedtuple("Persona", "name hp stats resistances moves")
+
+
+def parse_moves(data) -> types.MappingProxyType:
+    """Parses the persona_lookup moves column, {"name": ["type", "severity"], ...}.
+    asyncpg hands JSON columns over as strings, but already decoded dicts work too."""
+    if isinstance(data, (str, bytes)):
+        data = json.loads(data)
+    return types.MappingProxyType({name: Move(name, type_, severity) for name, (type_, severity) in data.items()})
+
+
+class PersonaCatalog:
+    """Every persona in persona_lookup, parsed once.
+
+    The catalog never changes after it's made. To pick up database changes,
+    load a new one and swap it in; anything holding the old one keeps a consistent view.
+    Lookups by name ignore case."""
+
+    __slots__ = ("_personas", "names")
+
+    def __init__(self, personas=()):
+        self._personas = {p.name.casefold(): p for p in personas}
+        self.names = frozenset(p.name for p in self._personas.values())
+
+    def __repr__(self):
+        return "<PersonaCatalog total={0}>".format(len(self._personas))
+
+    def __len__(self):
+        return len(self._personas)
+
+    def __iter__(self):
+        return iter(self._personas.values())
+
+    def __contains__(self, name):
+        return name.casefold() in self._personas
+
+    def __getitem__(self, name) -> Persona:
+        return self._personas[name.casefold()]
+
+    def get(self, name, default=None):
+        return self._personas.get(name.casefold(), default)
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls(Persona(row['name'], row['hp'], tuple(row['stats']), tuple(row['resistances']),
+                           parse_moves(row['moves'])) for row in rows)
+
+    @classmethod
+    async def fetch(cls, db):
+        """Loads a catalog from the database, `db` being the bots pool or a connection."""
+        return cls.from_rows(await db.fetch("SELECT name, hp, stats, resistances, moves FROM persona_lookup;"))
@@ -0,0 +1,208 @@
+import asyncio
+import collections
+import hashlib
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageDraw, ImageFont
+
+
+AVATAR_SIZE = (256, 256)
+
+# where each block of text goes on the profile, in the same order as the lines passed to render()
+TEXT_POSITIONS = ((5, 255), (265, 0), (265, 125), (265, 205))
+
+log = logging.getLogger("Adventure.PlayerManager")
+
+# everything needed to draw a profile, as plain data so it can be sent to another process
+# avatar: the raw RGBA pixels of the avatar, already resized to AVATAR_SIZE
+# lines: the four blocks of text, see TEXT_POSITIONS
+# background: a (width, height, raw RGBA pixels) tuple, or None for the default background
+# colour: the (r, g, b) text colour
+ProfileSpec = collections.namedtuple("ProfileSpec", "avatar lines background colour")
+
+
+class RenderQueueFull(Exception):
+    """Raised by RenderPool.render when too many renders are already waiting."""
+
+
+class ProfileRenderer:
+    """Draws profile images.
+
+    Fonts are loaded once per size, and the default background is kept
+    decoded as RGBA so it only needs copying per render."""
+
+    def __init__(self, background="assets/profile_background.png", font="assets/Inkfree.ttf"):
+        self._font_path = font
+        self._fonts = {}
+        with open(background, "rb") as f:
+            self.background = Image.open(io.BytesIO(f.read())).convert("RGBA")
+
+    def __repr__(self):
+        return "<ProfileRenderer fonts={0}>".format(len(self._fonts))
+
+    def font(self, size=35):
+        try:
+            return self._fonts[size]
+        except KeyError:
+            font = self._fonts[size] = ImageFont.truetype(self._font_path, size)
+            return font
+
+    @staticmethod
+    def prepare_avatar(data: io.BytesIO) -> Image.Image:
+        return Image.open(data).convert("RGBA").resize(AVATAR_SIZE)
+
+    @staticmethod
+    def prepare_background(data: io.BytesIO) -> Image.Image:
+        return Image.open(data).convert("RGBA")
+
+    def render(self, avatar: Image.Image, lines, *, background: Image.Image = None, colour=(255, 255, 255)):
+        """Draws a profile and returns it as a PNG.
+
+        `avatar` should already be passed through prepare_avatar,
+        and `lines` is the four blocks of text in TEXT_POSITIONS order."""
+        image = (background or self.background).copy()
+        image.paste(avatar, (0, 0), avatar)
+        draw = ImageDraw.Draw(image)
+        font = self.font()
+        for position, text in zip(TEXT_POSITIONS, lines):
+            draw.text(position, text, colour, font)
+        buffer = io.BytesIO()
+        image.save(buffer, "png")
+        buffer.seek(0)
+        return buffer
+
+
+_renderer = None
+
+
+def render_spec(spec: ProfileSpec) -> bytes:
+    """Renders a ProfileSpec to PNG bytes, using a renderer shared by the current process."""
+    global _renderer
+    if _renderer is None:
+        _renderer = ProfileRenderer()
+    avatar = Image.frombytes("RGBA", AVATAR_SIZE, spec.avatar)
+    if spec.background is None:
+        background = None
+    else:
+        width, height, pixels = spec.background
+        background = Image.frombytes("RGBA", (width, height), pixels)
+    return _renderer.render(avatar, spec.lines, background=background, colour=spec.colour).getvalue()
+
+
+class RenderPool:
+    """Runs render_spec in a pool of worker processes,
+    so drawing and PNG encoding don't hold the bots GIL.
+
+    With `workers` set to 0, or after the pool dies, renders run
+    in the event loops default thread pool instead.
+    At most `concurrency` renders (by default one per worker, or 4 with threads)
+    are submitted at once, and up to `queue_size` more wait their turn.
+    Past that, render raises RenderQueueFull straight away instead of queueing."""
+
+    def __init__(self, workers=0, queue_size=16, *, concurrency=None, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.workers = workers
+        self.queue_size = queue_size
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(concurrency or workers or 4)
+        self._pool = ProcessPoolExecutor(workers) if workers > 0 else None
+
+    def __repr__(self):
+        return "<RenderPool backend={0} waiting={1.waiting} rejected={1.rejected}>".format(
+            "process" if self._pool else "thread", self)
+
+    async def render(self, spec: ProfileSpec) -> bytes:
+        if self._semaphore.locked() and self.waiting >= self.queue_size:
+            self.rejected += 1
+            raise RenderQueueFull()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            if self._pool is not None:
+                try:
+                    return await self.loop.run_in_executor(self._pool, render_spec, spec)
+                except BrokenProcessPool:
+                    log.critical("Profile render pool died. Falling back to threads.")
+                    self._pool.shutdown(wait=False)
+                    self._pool = None
+            return await self.loop.run_in_executor(None, render_spec, spec)
+        finally:
+            self._semaphore.release()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+class RenderCache:
+    """An LRU cache of rendered profiles, bounded by the total size of the images.
+
+    Entries are keyed by a hash of everything that shows up in the image,
+    so a cached render is only reused when it would look the same.
+    If the same profile is requested while it is still rendering,
+    the requests wait on the one render instead of starting another."""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        self._pending = {}
+
+    def __repr__(self):
+        return ("<RenderCache entries={0} size={1.size} hits={1.hits} misses={1.misses} shared={1.shared} "
+                "evictions={1.evictions}>".format(len(self._entries), self))
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    async def get(self, key, factory) -> bytes:
+        """Returns the cached image for `key`.
+        On a miss, `factory` is awaited for the PNG bytes and the result is cached."""
+        try:
+            self._entries.move_to_end(key)
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return self._entries[key]
+        task = self._pending.get(key)
+        if task is None:
+            self.misses += 1
+            task = self._pending[key] = asyncio.ensure_future(self._render(key, factory))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    async def _render(self, key, factory):
+        try:
+            data = await factory()
+        finally:
+            del self._pending[key]
+        if len(data) <= self.max_bytes:
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, old = self._entries.popitem(last=False)
+                self.size -= len(old)
+                self.evictions += 1
+        return data
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
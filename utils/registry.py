@@ -0,0 +1,186 @@
+import bisect
+import heapq
+import itertools
+
+
+class RankedIndex:
+    """Keeps user IDs sorted by a score, highest first.
+
+    Updating a score is a binary search plus a list insert,
+    and reading the top N is just slicing from the front."""
+
+    __slots__ = ("_keys", "_scores")
+
+    def __init__(self):
+        self._keys = []  # sorted list of (-score, user_id)
+        self._scores = {}
+
+    def __repr__(self):
+        return "<RankedIndex total={0}>".format(len(self._scores))
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __iter__(self):
+        """Yields user IDs from the highest score to the lowest.
+        The index must not be changed while this is being consumed."""
+        return (user_id for _, user_id in self._keys)
+
+    def score(self, user_id):
+        return self._scores.get(user_id)
+
+    def set(self, user_id, score):
+        old = self._scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-old, user_id))]
+        bisect.insort(self._keys, (-score, user_id))
+        self._scores[user_id] = score
+
+    def load(self, scores):
+        """Sets many scores at once from (user_id, score) pairs,
+        re-sorting the index once instead of inserting each one."""
+        self._scores.update(scores)
+        self._keys = sorted((-score, user_id) for user_id, score in self._scores.items())
+
+    def discard(self, user_id):
+        old = self._scores.pop(user_id, None)
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-old, user_id))]
+
+    def clear(self):
+        self._keys.clear()
+        self._scores.clear()
+
+
+class PlayerRegistry:
+    """Holds every loaded player, keyed by the owners user ID.
+
+    Iterating over the registry yields the players themselves,
+    so it can be used anywhere the old list was.
+
+    Players are also ranked by experience ("exp") and by
+    total demons caught ("caught") for the leaderboards."""
+
+    __slots__ = ("_players", "_ranks")
+
+    def __init__(self):
+        self._players = {}
+        self._ranks = {"exp": RankedIndex(), "caught": RankedIndex()}
+
+    def __repr__(self):
+        return "<PlayerRegistry total={0}>".format(len(self._players))
+
+    def __iter__(self):
+        return iter(list(self._players.values()))
+
+    def __len__(self):
+        return len(self._players)
+
+    def __contains__(self, item):
+        """Accepts a Player, a user (anything with an id) or a user ID.
+        A Player is only in the registry if it's the loaded one, like with the old list."""
+        owner_id = getattr(item, "owner_id", None)
+        if owner_id is not None:
+            return self._players.get(owner_id) is item
+        return getattr(item, "id", item) in self._players
+
+    def get(self, user_id):
+        """Returns the player owned by `user_id`, or None if they aren't loaded."""
+        return self._players.get(user_id)
+
+    def add(self, player):
+        """Adds a player to the registry, replacing any player that the owner already had."""
+        self._players[player.owner_id] = player
+        self.update_rank(player)
+
+    def load(self, players):
+        """Adds many players at once, like add, but builds each ranking with a single sort.
+        Used when every player is loaded at startup."""
+        players = list(players)
+        self._players.update((p.owner_id, p) for p in players)
+        # a later player for the same owner replaces the earlier one, like add
+        players = [p for p in players if self._players[p.owner_id] is p]
+        self._ranks["exp"].load((p.owner_id, p.exp) for p in players)
+        self._ranks["caught"].load((p.owner_id, p.compendium.count) for p in players)
+
+    def remove(self, player):
+        """Removes a player from the registry.
+        Raises KeyError if that player isn't loaded."""
+        if self._players.get(player.owner_id) is not player:
+            raise KeyError(repr(player))
+        del self._players[player.owner_id]
+        for index in self._ranks.values():
+            index.discard(player.owner_id)
+
+    def discard(self, player):
+        """Same as remove, but does nothing if the player isn't loaded."""
+        try:
+            self.remove(player)
+        except KeyError:
+            pass
+
+    def clear(self):
+        self._players.clear()
+        for index in self._ranks.values():
+            index.clear()
+
+    def update_rank(self, player):
+        """Re-ranks a player after their exp or compendium changed.
+        Players that aren't in the registry (eg tutorial players) are ignored."""
+        if self._players.get(player.owner_id) is not player:
+            return
+        self._ranks["exp"].set(player.owner_id, player.exp)
+        self._ranks["caught"].set(player.owner_id, player.compendium.count)
+
+    def top_of(self, key, user_ids, count):
+        """Same as top, but only ranks the players in `user_ids`."""
+        index = self._ranks[key]
+        ids = [i for i in user_ids if i in self._players]
+        return [self._players[i] for i in heapq.nlargest(max(0, count), ids, key=index.score)]
+
+    def top(self, key, count, *, exclude=(), check=None):
+        """Returns up to `count` players with the highest `key`, either "exp" or "caught".
+
+        User IDs in `exclude` are skipped, and if `check` is passed
+        only user IDs it returns True for are included."""
+        ids = (i for i in self._ranks[key] if i not in exclude and (check is None or check(i)))
+        return [self._players[i] for i in itertools.islice(ids, max(0, count))]
+
+
+class GuildIndex:
+    """Maps guild IDs to the IDs of the players that are members of them."""
+
+    __slots__ = ("_guilds", "_users")
+
+    def __init__(self):
+        self._guilds = {}
+        self._users = {}
+
+    def __repr__(self):
+        return "<GuildIndex guilds={0} players={1}>".format(len(self._guilds), len(self._users))
+
+    def members(self, guild_id):
+        """Returns a set of player IDs in the guild. Don't modify it."""
+        return self._guilds.get(guild_id, frozenset())
+
+    def add(self, guild_id, user_id):
+        self._guilds.setdefault(guild_id, set()).add(user_id)
+        self._users.setdefault(user_id, set()).add(guild_id)
+
+    def discard(self, guild_id, user_id):
+        self._guilds.get(guild_id, set()).discard(user_id)
+        self._users.get(user_id, set()).discard(guild_id)
+
+    def remove_guild(self, guild_id):
+        for user_id in self._guilds.pop(guild_id, ()):
+            self._users[user_id].discard(guild_id)
+
+    def remove_user(self, user_id):
+        for guild_id in self._users.pop(user_id, ()):
+            self._guilds[guild_id].discard(user_id)
+
+    def clear(self):
+        self._guilds.clear()
+        self._users.clear()
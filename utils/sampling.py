@@ -0,0 +1,56 @@
+import random
+
+
+class AliasTable:
+    """Picks items at random, in proportion to their weights, in constant time.
+
+    This is Walker's alias method: the table is built once in O(n),
+    then each sample is one uniform pick and one biased coin flip."""
+
+    __slots__ = ("items", "weights", "_probability", "_alias")
+
+    def __init__(self, items, weights=None):
+        self.items = tuple(items)
+        if not self.items:
+            raise ValueError("AliasTable needs at least one item")
+        if weights is None:
+            weights = [1] * len(self.items)
+        self.weights = tuple(float(w) for w in weights)
+        if len(self.weights) != len(self.items):
+            raise ValueError("AliasTable needs one weight per item")
+        if any(w < 0 for w in self.weights) or not sum(self.weights):
+            raise ValueError("AliasTable weights must be positive")
+
+        count = len(self.items)
+        total = sum(self.weights)
+        scaled = [w * count / total for w in self.weights]
+        self._probability = [1.0] * count
+        self._alias = list(range(count))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._probability[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] -= 1 - scaled[less]
+            (small if scaled[more] < 1 else large).append(more)
+        # anything left over is 1 give or take float error
+
+    def __repr__(self):
+        return "<AliasTable items={0}>".format(len(self.items))
+
+    def __len__(self):
+        return len(self.items)
+
+    def sample(self, rng=random):
+        i = int(rng.random() * len(self.items))
+        return self.items[i] if rng.random() < self._probability[i] else self.items[self._alias[i]]
+
+    def probabilities(self) -> dict:
+        """Returns {item: chance of being picked}, worked out from the table itself."""
+        count = len(self.items)
+        chances = dict.fromkeys(self.items, 0.0)
+        for i, item in enumerate(self.items):
+            chances[item] += self._probability[i] / count
+            chances[self.items[self._alias[i]]] += (1 - self._probability[i]) / count
+        return chances
@@ -0,0 +1,261 @@
+import heapq
+import json
+import mmap
+import os
+import struct
+
+# A compiled world is a single little endian file, laid out as:
+#   header      HEADER
+#   maps        count * MAP_RECORD, in the order MapManager would load the JSON files
+#   adjacency   (count + 1) * u32 offsets into the two arrays below, like a CSR matrix
+#   nearby      edges * u32 map indexes
+#   weights     edges * i64 travel weights (the sum of both densities)
+#   listed      (count + 1) * u32 offsets into the array below
+#   listed IDs  listed * i64 map IDs each file has in "nearby", as written, for reloading it
+#   distances   count * count * i64 route weights, -1 when there's no route
+#   previous    count * count * i32 index of the previous map on the route, -1 at the start or with no route
+#   strings     the utf-8 names and descriptions
+# Every section starts on an 8 byte boundary, so they can be used straight from the mmap.
+# The arrays are read in native byte order, so a snapshot should be built on the machine running the bot.
+MAGIC = b"ADVWORLD"
+VERSION = 2
+HEADER = struct.Struct("<8sHxxIIII")  # magic, version, count, edges, listed, strings size
+# id, density, colour, safe, flags, name offset/size, description offset/size
+MAP_RECORD = struct.Struct("<qqIBB2xIIII")
+
+# which of the optional keys the map file has, so the data matches the file exactly
+HAS_DESCRIPTION = 1
+NULL_DESCRIPTION = 2
+HAS_SAFE = 4
+HAS_COLOUR = 8
+
+
+def _align(size):
+    return -(-size // 8) * 8
+
+
+def map_sources(directory="maps"):
+    """Returns {file name: mtime} for the map JSON files in `directory`, skipping anything else in it."""
+    return {e.name: e.stat().st_mtime for e in os.scandir(directory) if e.is_file() and e.name.endswith(".json")}
+
+
+def _load_sources(directory):
+    maps = []
+    for file in sorted(map_sources(directory), key=lambda i: i.lower()):
+        with open(os.path.join(directory, file)) as f:
+            try:
+                data = json.load(f)
+            except ValueError as e:
+                raise ValueError(f"{file}: {e}") from None
+        for key, kind in (("id", int), ("name", str), ("density", int), ("nearby", list)):
+            if not isinstance(data.get(key), kind):
+                raise ValueError(f"{file}: \"{key}\" should be {kind.__name__}")
+        if not all(isinstance(i, int) for i in data["nearby"]):
+            raise ValueError(f"{file}: \"nearby\" should only have map IDs")
+        maps.append(data)
+    return maps
+
+
+def compile_world(directory="maps") -> bytes:
+    """Compiles the map JSON files in `directory` into a snapshot.
+    Raises ValueError if a map is malformed, or two maps share an ID."""
+    maps = _load_sources(directory)
+    index = {}
+    for i, data in enumerate(maps):
+        if data["id"] in index:
+            raise ValueError(f"Map ID {data['id']} is used by both {maps[index[data['id']]]['name']} and {data['name']}")
+        index[data["id"]] = i
+
+    # link nearby maps both ways, the same way MapManager._add_map_nearby does
+    nearby = [[] for _ in maps]
+    for i, data in enumerate(maps):
+        for map_id in data["nearby"]:
+            j = index.get(map_id)
+            if j is None or j == i or j in nearby[i] or i in nearby[j]:
+                continue
+            nearby[i].append(j)
+            nearby[j].append(i)
+
+    count = len(maps)
+    offsets = [0]
+    for n in nearby:
+        offsets.append(offsets[-1] + len(n))
+    flat = [j for n in nearby for j in n]
+    weights = [maps[i]["density"] + maps[j]["density"] for i, n in enumerate(nearby) for j in n]
+
+    distances = [-1] * (count * count)
+    previous = [-1] * (count * count)
+    for source in range(count):
+        row = source * count
+        heap = [(0, source)]
+        distances[row + source] = 0
+        done = set()
+        while heap:
+            weight, node = heapq.heappop(heap)
+            if node in done:
+                continue
+            done.add(node)
+            for k in range(offsets[node], offsets[node + 1]):
+                target, total = flat[k], weight + weights[k]
+                if target not in done and (distances[row + target] == -1 or total < distances[row + target]):
+                    distances[row + target] = total
+                    previous[row + target] = node
+                    heapq.heappush(heap, (total, target))
+
+    listed_offsets = [0]
+    for data in maps:
+        listed_offsets.append(listed_offsets[-1] + len(data["nearby"]))
+    listed = [map_id for data in maps for map_id in data["nearby"]]
+
+    strings = bytearray()
+    records = bytearray()
+    for data in maps:
+        name = data["name"].encode()
+        description = (data.get("description") or "").encode()
+        flags = 0
+        if "description" in data:
+            flags |= HAS_DESCRIPTION | (NULL_DESCRIPTION if data["description"] is None else 0)
+        if "safe" in data:
+            flags |= HAS_SAFE
+        if "colour" in data:
+            flags |= HAS_COLOUR
+        records += MAP_RECORD.pack(data["id"], data["density"], data.get("colour", 0), bool(data.get("safe", False)),
+                                   flags, len(strings), len(name), len(strings) + len(name), len(description))
+        strings += name + description
+
+    edges = len(flat)
+    sections = (
+        bytes(records),
+        struct.pack(f"<{count + 1}I", *offsets),
+        struct.pack(f"<{edges}I", *flat),
+        struct.pack(f"<{edges}q", *weights),
+        struct.pack(f"<{count + 1}I", *listed_offsets),
+        struct.pack(f"<{len(listed)}q", *listed),
+        struct.pack(f"<{count * count}q", *distances),
+        struct.pack(f"<{count * count}i", *previous),
+        bytes(strings),
+    )
+    out = bytearray(HEADER.pack(MAGIC, VERSION, count, edges, len(listed), len(strings)))
+    out += bytes(_align(len(out)) - len(out))
+    for section in sections:
+        out += section
+        out += bytes(_align(len(out)) - len(out))
+    return bytes(out)
+
+
+class WorldSnapshot:
+    """A compiled world, read straight from a memory mapped file.
+
+    Build one with `python -m tools.build_world`.
+    Route rows are only decoded when they're asked for."""
+
+    __slots__ = ("path", "count", "_file", "_mmap", "_records", "_offsets", "_nearby", "_weights",
+                 "_listed_offsets", "_listed", "_distances", "_previous", "_strings", "_ids", "_index")
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise ValueError(f"{path} is not a world snapshot") from None
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def __repr__(self):
+        return "<WorldSnapshot path='{0.path}' maps={0.count}>".format(self)
+
+    def _parse(self):
+        view = memoryview(self._mmap)
+        try:
+            magic, version, count, edges, listed, strings = HEADER.unpack_from(view)
+        except struct.error:
+            magic = version = None
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{self.path} is not a version {VERSION} world snapshot")
+        self.count = count
+        position = _align(HEADER.size)
+
+        def take(size, fmt=None):
+            nonlocal position
+            section = view[position:position + size]
+            if len(section) != size:
+                raise ValueError(f"{self.path} is truncated")
+            position = _align(position + size)
+            return section.cast(fmt) if fmt else section
+
+        self._records = take(count * MAP_RECORD.size)
+        self._offsets = take((count + 1) * 4, "I")
+        self._nearby = take(edges * 4, "I")
+        self._weights = take(edges * 8, "q")
+        self._listed_offsets = take((count + 1) * 4, "I")
+        self._listed = take(listed * 8, "q")
+        self._distances = take(count * count * 8, "q")
+        self._previous = take(count * count * 4, "i")
+        self._strings = take(strings)
+        self._ids = [MAP_RECORD.unpack_from(self._records, i * MAP_RECORD.size)[0] for i in range(count)]
+        self._index = {map_id: i for i, map_id in enumerate(self._ids)}
+
+    @staticmethod
+    def is_fresh(path, directory="maps") -> bool:
+        """Whether the snapshot at `path` exists and is newer than every map file in `directory`."""
+        try:
+            built = os.stat(path).st_mtime
+        except OSError:
+            return False
+        newest = os.stat(directory).st_mtime  # files being added or removed
+        return built > max([newest, *map_sources(directory).values()])
+
+    def maps(self):
+        """Yields each map as the keyword arguments for utils.Map, the same as its JSON file.
+        nearby is the list of IDs from the file, see edges() for the links both ways."""
+        for i in range(self.count):
+            map_id, density, colour, safe, flags, name, name_size, desc, desc_size = \
+                MAP_RECORD.unpack_from(self._records, i * MAP_RECORD.size)
+            data = dict(
+                id=map_id,
+                name=bytes(self._strings[name:name + name_size]).decode(),
+                nearby=self._listed[self._listed_offsets[i]:self._listed_offsets[i + 1]].tolist(),
+                density=density,
+            )
+            if flags & HAS_DESCRIPTION:
+                data["description"] = None if flags & NULL_DESCRIPTION else \
+                    bytes(self._strings[desc:desc + desc_size]).decode()
+            if flags & HAS_COLOUR:
+                data["colour"] = colour
+            if flags & HAS_SAFE:
+                data["safe"] = bool(safe)
+            yield data
+
+    def edges(self):
+        """Yields (map ID, nearby map ID, weight) for every link, once in each direction."""
+        for i in range(self.count):
+            for k in range(self._offsets[i], self._offsets[i + 1]):
+                yield self._ids[i], self._ids[self._nearby[k]], self._weights[k]
+
+    def route_table(self, map_id):
+        """Returns the routes from `map_id` in the format of utils.shortest_paths,
+        or None if the map isn't in the snapshot."""
+        source = self._index.get(map_id)
+        if source is None:
+            return None
+        row = source * self.count
+        table = {}
+        for target in range(self.count):
+            weight = self._distances[row + target]
+            if weight >= 0:
+                previous = self._previous[row + target]
+                table[self._ids[target]] = (None if previous < 0 else self._ids[previous], weight)
+        return table
+
+    def close(self):
+        for view in ("_records", "_offsets", "_nearby", "_weights", "_listed_offsets", "_listed",
+                     "_distances", "_previous", "_strings"):
+            if hasattr(self, view):
+                getattr(self, view).release()
+        self._mmap.close()
+        self._file.close()